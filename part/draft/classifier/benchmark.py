@@ -0,0 +1,124 @@
+import collections as c
+import concurrent.futures as cf
+import itertools as it
+import math as m
+import time
+import typing as t
+
+import numpy as np
+
+from scipy.sparse import coo_matrix
+
+from feature import FAMILIES, resize, structure
+from train import balance
+
+
+def resize_loop(matrix: coo_matrix, size: int = 64, flat: bool = True) -> np.ndarray:
+    '''Reference per-entry implementation that `feature.resize` replaced'''
+    ans = np.zeros((size, size), dtype=np.float64)
+    delta = m.ceil(matrix.shape[0] / size)
+    rows, cols = matrix.row//delta, matrix.col//delta
+    counter = c.Counter(zip(rows, cols))
+    for ith, jth, value in zip(rows, cols, matrix.data):
+        ans[ith, jth] += value / counter[(ith, jth)]
+    ans /= max(1.0, abs(ans.max()), abs(ans.min()))  # normalize
+    if flat:
+        return ans.flatten()
+    else:
+        arrays = [
+            ans.diagonal(0), *it.chain(*(
+                (ans.diagonal(ith), ans.diagonal(-ith))
+                for ith in range(1, 32)
+            ))
+        ]
+        return np.concatenate(arrays, axis=0)
+
+
+def balance_loop(xs: np.ndarray, ys: np.ndarray) -> t.Tuple[np.ndarray, np.ndarray]:
+    '''Reference per-row implementation that `train.balance` replaced'''
+    data = c.defaultdict(list)
+    for x, y in zip(xs, ys):
+        data[y].append(x)
+    maximal = max(len(xs) for xs in data.values())
+    for y, xs in data.items():
+        count = len(xs)
+        for ith in np.random.choice(range(count), maximal-count):
+            x = data[y][ith]
+            data[y].append(x + 0.1 * np.random.random(x.size) * (x!=0.0))
+    ans_xs, ans_ys = [], []
+    for y, xs in data.items():
+        for x in xs:
+            ans_xs.append(x)
+            ans_ys.append(y)
+    idx = np.random.permutation(range(len(ans_xs)))
+    return np.array(ans_xs)[idx], np.array(ans_ys)[idx]
+
+
+def synthetic(n: int, nnz: int, seed: int = 0) -> coo_matrix:
+    '''Random square COO matrix, duplicated coordinates included'''
+    rng = np.random.default_rng(seed)
+    rows, cols = rng.integers(0, n, nnz), rng.integers(0, n, nnz)
+    return coo_matrix((rng.standard_normal(nnz), (rows, cols)), shape=(n, n))
+
+
+def benchmark(nnzs: t.Iterable[int] = (10**3, 10**4, 10**5, 10**6), n: int = 100_000, size: int = 32) -> None:
+    empty = coo_matrix((n, n))
+    for flat in [True, False]:
+        assert np.array_equal(resize_loop(empty, size, flat), resize(empty, size, flat))
+    print(f'{"nnz":>10} {"flat":>6} {"loop/s":>10} {"vector/s":>10} {"speed-up":>10}')
+    for nnz in nnzs:
+        matrix = synthetic(n, nnz, seed=nnz)
+        for flat in [True, False]:
+            tic = time.perf_counter()
+            expected = resize_loop(matrix, size, flat)
+            toc = time.perf_counter()
+            actual = resize(matrix, size, flat)
+            tac = time.perf_counter()
+            assert np.array_equal(expected, actual)  # bitwise, not approximately
+            print(f'{matrix.nnz:>10} {flat!s:>6} {toc-tic:>10.3f} {tac-toc:>10.4f} {(toc-tic)/(tac-toc):>10.1f}')
+
+
+def benchmark_structure(nnzs: t.Iterable[int] = (10**4, 10**5, 10**6), n: int = 100_000, repeat: int = 5) -> None:
+    '''Milliseconds per feature family of `feature.structure` (best of `repeat`)'''
+    print(f'{"nnz":>10}', *(f'{family+"/ms":>13}' for family in FAMILIES), f'{"total/ms":>10}')
+    for nnz in nnzs:
+        matrix = synthetic(n, nnz, seed=nnz).tocsr()
+        best = min((structure(matrix)[1] for _ in range(repeat)), key=lambda timings: sum(timings.values()))
+        print(f'{matrix.nnz:>10}', *(f'{best[family]*1e3:>13.3f}' for family in FAMILIES), f'{sum(best.values())*1e3:>10.3f}')
+
+
+def benchmark_balance(rows: t.Iterable[int] = (10**3, 10**4, 10**5), features: int = 1024, classes: int = 16) -> None:
+    '''Oversampling time; both versions must give every class the size of the largest one'''
+    print(f'{"rows":>10} {"loop/s":>10} {"vector/s":>10} {"speed-up":>10}')
+    rng = np.random.default_rng(0)
+    for row in rows:
+        xs = rng.random((row, features)) * (rng.random((row, features)) < 0.1)
+        ys = np.minimum(rng.geometric(0.3, row)-1, classes-1)
+        tic = time.perf_counter()
+        _, expected = balance_loop(xs, ys)
+        toc = time.perf_counter()
+        _, actual = balance(xs, ys, rng)
+        tac = time.perf_counter()
+        assert np.array_equal(np.bincount(expected), np.bincount(actual))
+        print(f'{row:>10} {toc-tic:>10.3f} {tac-toc:>10.4f} {(toc-tic)/(tac-toc):>10.1f}')
+
+
+def benchmark_recommender(count: int = 256, distinct: int = 64, threads: int = 8, n: int = 10_000, nnz: int = 50_000) -> None:
+    '''Client-side p50/p99 latency of `serve.Recommender` with concurrent callers and repeated matrices'''
+    from serve import Recommender
+    recommender = Recommender()
+    matrices = [synthetic(n, nnz, seed=seed).tocsr() for seed in range(distinct)]
+    def call(ith: int) -> float:
+        tic = time.perf_counter()
+        recommender.recommend(matrices[ith%distinct])
+        return time.perf_counter() - tic
+    with cf.ThreadPoolExecutor(threads) as pool:
+        latencies = np.array(list(pool.map(call, range(count))))
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1e3
+    print(f'{"count":>10} {"distinct":>10} {"threads":>10} {"p50/ms":>10} {"p99/ms":>10}')
+    print(f'{count:>10} {distinct:>10} {threads:>10} {p50:>10.3f} {p99:>10.3f}')
+
+
+if __name__ == '__main__':
+    benchmark()
+    benchmark_structure()
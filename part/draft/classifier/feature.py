@@ -0,0 +1,221 @@
+import concurrent.futures as cf
+import itertools as it
+import json
+import math as m
+import os
+import pathlib as p
+import time
+import typing as t
+
+import numpy as np
+import tqdm
+import typing_extensions as te
+
+from scipy.sparse import coo_matrix, csr_matrix
+
+
+Featurize = t.Callable[[csr_matrix], np.ndarray]
+Timings = t.Dict[str, float]
+
+FAMILIES = ('read', 'bandwidth', 'dominance', 'symmetry', 'histogram', 'pyramid')
+
+
+class Loader(t.Protocol):
+    '''What `FeatureStore` needs from a matrix cache (see `suite_sparse.csr.CSRCache`)'''
+
+    def load(self, path: p.Path) -> csr_matrix: ...
+    def digest(self, path: p.Path) -> str: ...
+
+
+def resize(matrix: coo_matrix, size: int = 64, flat: bool = True) -> np.ndarray:
+    '''Average of the entries falling into each cell of a `size x size` grid
+
+    Every entry is divided by the population of its cell and the quotients are
+    accumulated with `np.bincount` in entry order, which is the same sequence of
+    floating-point operations as a per-entry loop.
+    '''
+    matrix = matrix.tocoo()
+    delta = m.ceil(matrix.shape[0] / size)
+    bins = (matrix.row//delta).astype(np.int64)*size + matrix.col//delta
+    counts = np.bincount(bins, minlength=size*size)
+    ans = np.bincount(bins, weights=matrix.data/counts[bins], minlength=size*size) \
+        .astype(np.float64, copy=False).reshape(size, size)  # integer counts when nnz == 0
+    ans /= max(1.0, abs(ans.max()), abs(ans.min()))  # normalize
+    if flat:
+        return ans.flatten()
+    else:
+        arrays = [
+            ans.diagonal(0), *it.chain(*(
+                (ans.diagonal(ith), ans.diagonal(-ith))
+                for ith in range(1, 32)
+            ))
+        ]
+        return np.concatenate(arrays, axis=0)
+
+
+def structure(
+    matrix: csr_matrix, sizes: t.Sequence[int] = (8, 16, 32), bins: int = 16,
+    probes: int = 8, chunk: int = 1 << 18, seed: int = 0,
+) -> t.Tuple[t.Dict[str, np.ndarray], Timings]:
+    '''Structural features of a square matrix in one streaming pass over its CSR rows
+
+    Rows are visited in blocks of about `chunk` entries, so with memory-mapped
+    arrays only one block is resident at a time. Families:
+
+    - bandwidth: lower and upper bandwidth relative to the order
+    - dominance: share of diagonally dominant rows, mean |a_ii| / sum_j |a_ij|
+    - symmetry: 1 - ||A-A^T||_F / (2 ||A||_F), numeric and for the pattern,
+      estimated with `probes` Rademacher pairs (z^T A w - w^T A z)
+    - histogram: share of rows per log2 bucket of row length
+    - pyramid: mean-value images of every size in `sizes`, normalized as `resize`
+
+    The seconds spent in every family are returned as well.
+    '''
+    n, indptr = matrix.shape[0], matrix.indptr
+    timings = dict.fromkeys(FAMILIES, 0.0)
+    rng = np.random.default_rng(seed)
+    zs, ws = rng.choice(np.array([-1, 1], dtype=np.int8), size=(2, probes, n))
+    lower = upper = dominant = 0
+    ratio = fro = nnz = 0.0
+    skews = {'numeric': np.zeros(probes), 'pattern': np.zeros(probes)}
+    histogram = np.zeros(bins, dtype=np.int64)
+    sums = {size: np.zeros(size*size) for size in sizes}
+    counts = {size: np.zeros(size*size, dtype=np.int64) for size in sizes}
+    start = 0
+    while start < n:
+        tic = time.perf_counter()
+        stop = int(np.searchsorted(indptr, indptr[start]+chunk, side='right')) - 1
+        stop = min(n, max(start+1, stop))
+        lengths = np.diff(np.asarray(indptr[start:stop+1], dtype=np.int64))
+        cols = np.asarray(matrix.indices[indptr[start]:indptr[stop]], dtype=np.int64)
+        vals = np.asarray(matrix.data[indptr[start]:indptr[stop]], dtype=np.float64)
+        local = np.repeat(np.arange(stop-start), lengths)
+        rows = local + start
+        toc = time.perf_counter(); timings['read'] += toc - tic; tic = toc
+        # bandwidth
+        if cols.size:
+            offsets = cols - rows
+            lower, upper = max(lower, -int(offsets.min())), max(upper, int(offsets.max()))
+        toc = time.perf_counter(); timings['bandwidth'] += toc - tic; tic = toc
+        # dominance
+        magnitudes = np.abs(vals)
+        diagonal = np.bincount(local, weights=magnitudes*(cols == rows), minlength=stop-start)
+        total = np.bincount(local, weights=magnitudes, minlength=stop-start)
+        dominant += int(np.count_nonzero(2*diagonal >= total))
+        ratio += float(np.sum(diagonal[total > 0] / total[total > 0]))
+        toc = time.perf_counter(); timings['dominance'] += toc - tic; tic = toc
+        # symmetry
+        fro += float(vals @ vals)
+        nnz += vals.size
+        cross = zs[:, rows]*ws[:, cols] - ws[:, rows]*zs[:, cols]
+        skews['numeric'] += cross @ vals
+        skews['pattern'] += cross.sum(axis=1)
+        toc = time.perf_counter(); timings['symmetry'] += toc - tic; tic = toc
+        # histogram
+        buckets = np.minimum(np.floor(np.log2(lengths+1)).astype(np.int64), bins-1)
+        histogram += np.bincount(buckets, minlength=bins)
+        toc = time.perf_counter(); timings['histogram'] += toc - tic; tic = toc
+        # pyramid
+        for size in sizes:
+            delta = m.ceil(n / size)
+            cells = (rows//delta)*size + cols//delta
+            sums[size] += np.bincount(cells, weights=vals, minlength=size*size)
+            counts[size] += np.bincount(cells, minlength=size*size)
+        timings['pyramid'] += time.perf_counter() - tic
+        start = stop
+    tic = time.perf_counter()
+    symmetry = lambda skew, norm: \
+        1.0 - min(1.0, m.sqrt(np.mean(skew**2)) / (2*m.sqrt(norm))) if norm > 0 else 1.0
+    images = []
+    for size in sizes:
+        image = np.divide(sums[size], counts[size], out=np.zeros(size*size), where=counts[size] > 0)
+        images.append(image / max(1.0, abs(image.max()), abs(image.min())))
+    features = {
+        'bandwidth': np.array([lower, upper]) / max(1, n-1),
+        'dominance': np.array([dominant/n, ratio/n]),
+        'symmetry': np.array([symmetry(skews['numeric'], fro), symmetry(skews['pattern'], nnz)]),
+        'histogram': histogram / n,
+        'pyramid': np.concatenate(images),
+    }
+    timings['pyramid'] += time.perf_counter() - tic
+    return features, timings
+
+
+def structure_vector(matrix: csr_matrix, **kwargs: t.Any) -> np.ndarray:
+    '''All `structure` families concatenated, for `FeatureStore`'''
+    features, _ = structure(matrix, **kwargs)
+    return np.concatenate([features[family] for family in FAMILIES[1:]])
+
+
+class FeatureStore:
+    '''Append-only per-matrix features keyed by content hash
+
+    `<root>/<digest>.npy` holds the features of one matrix and `<root>/index.json`
+    maps every matrix path to its digest, so an update only featurizes matrices
+    that are new or whose content changed; failures are remembered by digest too.
+    '''
+
+    def __init__(self, root: p.Path, loader: Loader, func: Featurize) -> None:
+        self._root = root
+        self._loader = loader
+        self._func = func
+        self._index_path = root / 'index.json'
+        index = json.loads(self._index_path.read_text()) if self._index_path.exists() else {}
+        self._paths: t.Dict[str, str] = index.get('paths', {})
+        self._failed: t.Set[str] = set(index.get('failed', []))
+
+    def __contains__(self, path: p.Path) -> bool:
+        digest = self._paths.get(path.as_posix())
+        return digest is not None and digest not in self._failed
+
+    def update(self, paths: t.Iterable[p.Path], jobs: t.Optional[int] = None) -> te.Self:
+        self._root.mkdir(parents=True, exist_ok=True)
+        for path in paths:
+            if path.exists():
+                self._paths[path.as_posix()] = self._loader.digest(path)
+        todo = {
+            digest: path for path, digest in self._paths.items()
+            if digest not in self._failed and not self._file(digest).exists()
+        }
+        with cf.ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {
+                executor.submit(_featurize, self._loader, self._func, p.Path(path), self._file(digest)): digest
+                for digest, path in todo.items()
+            }
+            for future in tqdm.tqdm(cf.as_completed(futures), total=len(futures)):
+                if future.exception() is not None:
+                    self._failed.add(futures[future])
+        self._index_path.write_text(json.dumps({'paths': self._paths, 'failed': sorted(self._failed)}))
+        return self
+
+    def load(self, path: p.Path) -> np.ndarray:
+        return np.load(self._file(self._paths[path.as_posix()]), mmap_mode='r')
+
+    def assemble(self, paths: t.Sequence[p.Path], dst: p.Path, fill: t.Optional[float] = None) -> None:
+        '''Stack the features of `paths` into the `.npy` file `dst`, row by row from memory maps
+
+        With `fill`, matrices that could not be featurized get a row of `fill` (e.g. `np.nan`),
+        so `dst` stays aligned with `paths`; without it every matrix must be in the store.
+        '''
+        present = paths if fill is None else [path for path in paths if path in self]
+        if not present:  # the shape of a row is only known from a featurized matrix
+            raise ValueError(f'no featurized matrix to assemble into {dst}')
+        first = self.load(present[0])
+        dtype = first.dtype if fill is None else np.result_type(first.dtype, fill)
+        tmp = dst.with_name(f'.{dst.name}.{os.getpid()}')
+        out = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype, shape=(len(paths), *first.shape))
+        for ith, path in enumerate(paths):
+            out[ith] = self.load(path) if fill is None or path in self else fill
+        out.flush()
+        del out
+        tmp.replace(dst)
+
+    def _file(self, digest: str) -> p.Path:
+        return self._root / f'{digest}.npy'
+
+
+def _featurize(loader: Loader, func: Featurize, src: p.Path, dst: p.Path) -> None:
+    tmp = dst.with_name(f'.{dst.name}.{os.getpid()}')
+    with open(tmp, 'wb') as file:
+        np.save(file, func(loader.load(src)))
+    tmp.replace(dst)
@@ -1,17 +1,21 @@
 import ast
-import collections as c
-import itertools as it
+import functools as f
 import json
-import math as m
 import pathlib as p
 import pickle
+import sys
 import typing as t
 
 import numpy as np
-import tqdm
 
-from scipy.io import mmread
-from scipy.sparse import coo_matrix
+root = p.Path(__file__).parent
+dir_dataset = root.parents[1] / 'hyper-parameter-optimization' / 'training-dataset'
+sys.path.insert(0, dir_dataset.as_posix())
+
+from feature import FeatureStore, resize, structure_vector
+from data_labeling import columnar
+from suite_sparse.config import CSR
+from suite_sparse.csr import CSRCache
 
 
 MetricsAll = t.Dict[str, t.Dict[t.Tuple[str, ...], float]]
@@ -19,6 +23,8 @@ MetricsBest = t.Dict[str, t.Tuple[str, ...]]
 
 
 def load_metrics_all(path: p.Path, keys: t.Tuple[str, ...], norm: float) -> MetricsAll:
+    if path.suffix == '.npz':
+        return load_metrics_all_columnar(path, keys, norm)
     ans: MetricsAll = {}
     with open(path, 'r') as file:
         file.readline()
@@ -38,69 +44,77 @@ def load_metrics_all(path: p.Path, keys: t.Tuple[str, ...], norm: float) -> Metr
     return ans
 
 
-def resize(matrix: coo_matrix, size: int = 64, flat: bool = True) -> np.ndarray:
-    ans = np.zeros((size, size), dtype=np.float64)
-    delta = m.ceil(matrix.shape[0] / size)
-    rows, cols = matrix.row//delta, matrix.col//delta
-    counter = c.Counter(zip(rows, cols))
-    for ith, jth, value in zip(rows, cols, matrix.data):
-        ans[ith, jth] += value / counter[(ith, jth)]
-    ans /= max(1.0, abs(ans.max()), abs(ans.min()))  # normalize
-    if flat:
-        return ans.flatten()
-    else:
-        arrays = [
-            ans.diagonal(0), *it.chain(*(
-                (ans.diagonal(ith), ans.diagonal(-ith))
-                for ith in range(1, 32)
-            ))
-        ]
-        return np.concatenate(arrays, axis=0)
-
+def load_metrics_all_columnar(path: p.Path, keys: t.Tuple[str, ...], norm: float) -> MetricsAll:
+    ans: MetricsAll = {}
+    with np.load(path, allow_pickle=False) as columns:
+        mask = columns['valid'] & (columns['norm'] <= norm)
+        parts = columns['path'][mask].tolist()
+        options = zip(*(columns[key][mask].tolist() for key in keys))
+        times = columns['time'][mask].tolist()
+    for part, option, time in zip(parts, options, times):
+        ans \
+            .setdefault(part, {}) \
+            .setdefault(option, time)
+    return ans
 
-root = p.Path(__file__).parent
 
 dir_cache = root / 'cache'
-dir_mtx = root.parents[1] / 'hyper-parameter-optimization' / 'training-dataset' / 'foam2mtx' / 'cache' / 'mtx' / '10'
-path_metrics = root.parents[1] / 'hyper-parameter-optimization' / 'training-dataset' / 'data_labeling' / 'metrics.tsv'
+dir_mtx = dir_dataset / 'foam2mtx' / 'cache' / 'mtx' / '10'
+path_metrics = dir_dataset / 'data_labeling' / 'metrics.npz'
+path_metrics_tsv = path_metrics.with_suffix('.tsv')
 path_metrics_all = dir_cache / 'metrics_all.pkl'
 path_metrics_best = dir_cache / 'metrics_best.pkl'
 path_mapper = dir_cache / 'mapper.json'
 path_xs = dir_cache / 'xs.npy'
 path_ys = dir_cache / 'ys.npy'
+path_xs_structure = dir_cache / 'xs_structure.npy'
 option_keys, norm = ('ksp_type', 'pc_type'), 1e-7
 length = 32
+dir_feature = dir_cache / 'feature' / f'resize-{length}'
+dir_feature_structure = dir_cache / 'feature' / 'structure'
+csr_cache = CSRCache(CSR)
+
+
+def main() -> None:
+    '''Featurize the labelled matrices into `xs.npy`, `xs_structure.npy` and `ys.npy`'''
+    # metrics (the columnar copy is rebuilt when the labels were appended to since)
+    if path_metrics.exists() and path_metrics.stat().st_mtime < path_metrics_tsv.stat().st_mtime:
+        columnar.save(path_metrics, columnar.tsv2columns(path_metrics_tsv))
+    path_table = path_metrics if path_metrics.exists() else path_metrics_tsv
+    # metrics_all (refreshed when the metrics table is newer)
+    if path_metrics_all.exists() and path_metrics_all.stat().st_mtime >= path_table.stat().st_mtime:
+        metrics_all = pickle.loads(path_metrics_all.read_bytes())
+    else:
+        path_metrics_all.parent.mkdir(parents=True, exist_ok=True)
+        metrics_all = load_metrics_all(path_table, option_keys, norm)
+        path_metrics_all.write_bytes(pickle.dumps(metrics_all))
+    # metrics_best
+    if path_metrics_best.exists() and path_metrics_best.stat().st_mtime >= path_metrics_all.stat().st_mtime:
+        metrics_best = pickle.loads(path_metrics_best.read_bytes())
+    else:
+        path_metrics_best.parent.mkdir(parents=True, exist_ok=True)
+        metrics_best = {
+            key: min(value, key=value.__getitem__)
+            for key, value in metrics_all.items()
+        }
+        path_metrics_best.write_bytes(pickle.dumps(metrics_best))
+    # matrices, indices (only new or changed matrices are featurized)
+    store = FeatureStore(dir_feature, csr_cache, f.partial(resize, size=length))
+    store.update(dir_mtx/filename for filename in metrics_best)
+    store_structure = FeatureStore(dir_feature_structure, csr_cache, structure_vector)
+    store_structure.update(dir_mtx/filename for filename in metrics_best)
+    # structural features are optional: a matrix they failed on gets a NaN row instead of being dropped
+    filenames = [filename for filename in metrics_best if dir_mtx/filename in store]
+    mappers = tuple(map(lambda x: sorted(set(x)), zip(*metrics_best.values())))
+    indices = [
+        list(map(lambda mo: list.index(*mo), zip(mappers, metrics_best[filename])))
+        for filename in filenames
+    ]
+    path_mapper.write_text(json.dumps(mappers, indent=4))
+    store.assemble([dir_mtx/filename for filename in filenames], path_xs)
+    store_structure.assemble([dir_mtx/filename for filename in filenames], path_xs_structure, fill=np.nan)
+    np.save(path_ys, np.array(indices))
+
 
-# metrics_all
-if path_metrics_all.exists():
-    metrics_all = pickle.loads(path_metrics_all.read_bytes())
-else:
-    path_metrics_all.parent.mkdir(parents=True, exist_ok=True)
-    metrics_all = load_metrics_all(path_metrics, option_keys, norm)
-    path_metrics_all.write_bytes(pickle.dumps(metrics_all))
-# metrics_best
-if path_metrics_best.exists():
-    metrics_best = pickle.loads(path_metrics_best.read_bytes())
-else:
-    path_metrics_best.parent.mkdir(parents=True, exist_ok=True)
-    metrics_best = {
-        key: min(value, key=value.__getitem__)
-        for key, value in metrics_all.items()
-    }
-    path_metrics_best.write_bytes(pickle.dumps(metrics_best))
-# matrices, indices
-if path_mapper.exists() and path_xs.exists() and path_ys.exists():
-    exit()
-matrices, indices = [], []
-mappers = tuple(map(lambda x: sorted(set(x)), zip(*metrics_best.values())))
-for filename, options in tqdm.tqdm(metrics_best.items()):
-    try:
-        matrix = resize(mmread(dir_mtx/filename), length)
-        index = list(map(lambda mo: list.index(*mo), zip(mappers, options)))
-    except Exception:
-        continue
-    matrices.append(matrix)
-    indices.append(index)
-path_mapper.write_text(json.dumps(mappers, indent=4))
-np.save(path_xs, np.array(matrices))
-np.save(path_ys, np.array(indices))
+if __name__ == '__main__':
+    main()  # the feature stores start process pools, which re-import this module
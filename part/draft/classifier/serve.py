@@ -0,0 +1,201 @@
+import collections as c
+import concurrent.futures as cf
+import hashlib
+import http.server
+import json
+import os
+import pathlib as p
+import queue
+import socketserver
+import sys
+import threading
+import time
+import typing as t
+
+import click
+import joblib
+import numpy as np
+
+from scipy.sparse import csr_matrix
+
+from feature import resize, structure_vector
+
+
+Ranking = t.List[t.Tuple[str, str, float]]  # (ksp_type, pc_type, probability), best first
+
+root = p.Path(__file__).parent
+dir_cache = root / 'cache'
+dir_dataset = root.parents[1] / 'hyper-parameter-optimization' / 'training-dataset'
+sys.path.insert(0, dir_dataset.as_posix())
+
+from suite_sparse.config import CSR
+from suite_sparse.csr import CSRCache
+
+
+def digest_csr(matrix: csr_matrix) -> str:
+    '''Content hash of a CSR payload, compatible in spirit with `CSRCache.digest`'''
+    sha256 = hashlib.sha256(np.asarray(matrix.shape, dtype=np.int64).tobytes())
+    for array in (matrix.indptr, matrix.indices, matrix.data):
+        sha256.update(np.ascontiguousarray(array).tobytes())
+    return sha256.hexdigest()
+
+
+class Recommender:
+    '''Ranked `(ksp_type, pc_type)` of matrices with the model dumped by `train.py`
+
+    The class labels are rebuilt exactly as `train.py` does (sorted distinct rows
+    of `ys.npy`) and mapped to option names with `mapper.json`; the structural features
+    are appended when the model was trained with them (`train.py --structure`). Rankings are kept
+    in an LRU cache keyed by the matrix hash, and concurrent requests are
+    gathered into micro-batches of at most `batch` matrices, waiting no longer
+    than `window` seconds for a batch to fill.
+    '''
+
+    def __init__(
+        self, directory: p.Path = dir_cache, size: int = 32, capacity: int = 1024,
+        batch: int = 32, window: float = 0.002,
+    ) -> None:
+        self._model = joblib.load(directory/'model.pkl')
+        mappers = json.loads((directory/'mapper.json').read_text())
+        keys = sorted(set(map(tuple, np.load(directory/'ys.npy').tolist())))
+        self._labels = [
+            tuple(mapper[index] for mapper, index in zip(mappers, keys[cls]))
+            for cls in self._model.classes_
+        ]
+        self._size, self._capacity, self._batch, self._window = size, capacity, batch, window
+        self._structure = self._model.n_features_in_ > size*size
+        self._csr_cache = CSRCache(CSR)
+        self._lru: t.OrderedDict[str, Ranking] = c.OrderedDict()
+        self._lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue()
+        self._latencies: t.Deque[float] = c.deque(maxlen=100_000)
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def recommend(self, matrix: t.Union[p.Path, str, csr_matrix]) -> t.Tuple[Ranking, bool]:
+        '''Ranking of one matrix (a MatrixMarket path or a CSR matrix) and whether it was cached'''
+        tic = time.perf_counter()
+        if isinstance(matrix, csr_matrix):
+            key, load = digest_csr(matrix), lambda: matrix
+        else:
+            key, load = self._csr_cache.digest(matrix), lambda: self._csr_cache.load(matrix)
+        with self._lock:
+            ranking = self._lru.get(key)
+            if ranking is not None:
+                self._lru.move_to_end(key)
+        cached = ranking is not None
+        if not cached:
+            future: cf.Future = cf.Future()
+            self._queue.put((self._featurize(load()), future))
+            ranking = future.result()
+            with self._lock:
+                self._lru[key] = ranking
+                while len(self._lru) > self._capacity:
+                    self._lru.popitem(last=False)
+        self._latencies.append(time.perf_counter()-tic)
+        return ranking, cached
+
+    def stats(self) -> t.Dict[str, float]:
+        latencies = np.array(self._latencies)
+        if not latencies.size:
+            return {'count': 0}
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1e3
+        return {'count': int(latencies.size), 'p50/ms': float(p50), 'p99/ms': float(p99), 'cached': len(self._lru)}
+
+    def _featurize(self, matrix: csr_matrix) -> np.ndarray:
+        x = resize(matrix, self._size)
+        return np.concatenate([x, structure_vector(matrix)]) if self._structure else x
+
+    def _loop(self) -> None:
+        while True:
+            items = [self._queue.get()]
+            deadline = time.perf_counter() + self._window
+            while len(items) < self._batch:
+                try:
+                    items.append(self._queue.get(timeout=max(0.0, deadline-time.perf_counter())))
+                except queue.Empty:
+                    break
+            try:
+                probabilities = self._model.predict_proba(np.stack([x for x, _ in items]))
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            for (_, future), probability in zip(items, probabilities):
+                order = np.argsort(-probability, kind='stable')
+                future.set_result([(*self._labels[ith], float(probability[ith])) for ith in order])
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    '''`POST /recommend` with `{"path": ...}` or `{"csr": {shape, data, indices, indptr}}`, `GET /stats`'''
+
+    recommender: Recommender
+
+    def do_GET(self) -> None:
+        if self.path == '/stats':
+            self._reply(200, self.recommender.stats())
+        else:
+            self._reply(404, {'error': self.path})
+
+    def do_POST(self) -> None:
+        if self.path != '/recommend':
+            return self._reply(404, {'error': self.path})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            if 'csr' in body:
+                csr = body['csr']
+                matrix = csr_matrix(
+                    (np.asarray(csr['data'], dtype=np.float64), np.asarray(csr['indices']), np.asarray(csr['indptr'])),
+                    shape=tuple(csr['shape']),
+                )
+            else:
+                matrix = p.Path(body['path'])
+            ranking, cached = self.recommender.recommend(matrix)
+        except Exception as e:
+            return self._reply(400, {'error': repr(e)})
+        self._reply(200, {'ranking': ranking, 'cached': cached})
+
+    def address_string(self) -> str:
+        return str(self.client_address[0]) if self.client_address else 'unix'
+
+    def log_message(self, format: str, *args: t.Any) -> None:
+        pass
+
+    def _reply(self, status: int, data: t.Any) -> None:
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+@click.command()
+@click.option('--host', type=str, default='127.0.0.1')
+@click.option('--port', type=int, default=8000)
+@click.option('--unix', type=click.Path(), default=None, help='Listen on a Unix socket instead of TCP')
+@click.option('--batch', type=int, default=32, help='Largest micro-batch')
+@click.option('--window', type=float, default=0.002, help='Seconds to wait for a micro-batch to fill')
+@click.option('--capacity', type=int, default=1024, help='Number of cached rankings')
+def main(host: str, port: int, unix: t.Optional[str], batch: int, window: float, capacity: int) -> None:
+    Handler.recommender = Recommender(capacity=capacity, batch=batch, window=window)
+    if unix is None:
+        server = http.server.ThreadingHTTPServer((host, port), Handler)
+    else:
+        if os.path.exists(unix):
+            os.unlink(unix)
+        server = UnixHTTPServer(unix, Handler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(Handler.recommender.stats())
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,55 +1,104 @@
-import collections as c
 import pathlib as p
+import resource
+import time
 import typing as t
 
+import click
 import joblib
 import numpy as np
 
-from sklearn.metrics import accuracy_score, f1_score, make_scorer, precision_score, recall_score
-from sklearn.model_selection import cross_val_score
-from sklearn.tree import DecisionTreeClassifier as Classifier
-
-
-def balance(xs: np.ndarray, ys: np.ndarray) -> t.Tuple[np.ndarray, np.ndarray]:
-    data = c.defaultdict(list)
-    for x, y in zip(xs, ys):
-        data[y].append(x)
-    maximal = max(len(xs) for xs in data.values())
-    for y, xs in data.items():
-        count = len(xs)
-        for ith in np.random.choice(range(count), maximal-count):
-            x = data[y][ith]
-            data[y].append(x + 0.1 * np.random.random(x.size) * (x!=0.0))
-    ans_xs, ans_ys = [], []
-    for y, xs in data.items():
-        for x in xs:
-            ans_xs.append(x)
-            ans_ys.append(y)
-    idx = np.random.permutation(range(len(ans_xs)))
-    return np.array(ans_xs)[idx], np.array(ans_ys)[idx]
+from joblib.externals.loky import get_reusable_executor
+from sklearn.base import ClassifierMixin
+from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
+from sklearn.model_selection import cross_validate
+from sklearn.tree import DecisionTreeClassifier
+
+
+ESTIMATORS: t.Dict[str, t.Callable[[int], ClassifierMixin]] = {
+    'tree': lambda seed: DecisionTreeClassifier(random_state=seed),
+    'forest': lambda seed: RandomForestClassifier(n_jobs=-1, random_state=seed),
+    'hgb': lambda seed: HistGradientBoostingClassifier(random_state=seed),  # OpenMP, all cores
+}
+SCORING = {
+    'accuracy': 'accuracy',
+    'precision': 'precision_macro',
+    'recall': 'recall_macro',
+    'f1': 'f1_macro',
+}
+
+
+def balance(xs: np.ndarray, ys: np.ndarray, rng: np.random.Generator) -> t.Tuple[np.ndarray, np.ndarray]:
+    '''Oversample every class to the size of the largest one
+
+    The extra rows are copies of random rows of the same class whose nonzero
+    features get a uniform jitter in `[0, 0.1)`; the result is shuffled.
+    '''
+    classes, counts = np.unique(ys, return_counts=True)
+    picks = np.concatenate([
+        rng.choice(np.flatnonzero(ys == y), counts.max()-count)
+        for y, count in zip(classes, counts)
+    ]).astype(np.int64)
+    extra = xs[picks]
+    mask = extra != 0.0
+    extra[mask] += 0.1 * rng.random(np.count_nonzero(mask))  # zeros stay zeros, no jitter drawn for them
+    order = rng.permutation(len(ys)+picks.size)
+    return np.concatenate([xs, extra])[order], np.concatenate([ys, ys[picks]])[order]
+
+
+def peak_memory() -> t.Tuple[float, float]:
+    '''Peak resident set size in MiB of this process and of its largest child process
+
+    Children only count once waited for, so the reusable loky executor that runs the
+    folds of `cross_validate` is shut down first and its workers are reaped.
+    '''
+    get_reusable_executor().shutdown(wait=True)
+    return tuple(
+        resource.getrusage(who).ru_maxrss / 1024
+        for who in [resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN]
+    )
 
 
 root = p.Path(__file__).parent
-xs: np.ndarray = np.load(root/'cache'/'xs.npy')
-ys: np.ndarray = np.load(root/'cache'/'ys.npy')
 path_model = root / 'cache' / 'model.pkl'
 
-# data-balance
-keys = sorted(set(map(tuple, ys)))
-ys = np.array(list(map(keys.index, map(tuple, ys))))
-xs, ys = balance(xs, ys)
-
-# cross-validation
-for scoring in [
-    make_scorer(accuracy_score),
-    make_scorer(precision_score, average='macro'),
-    make_scorer(recall_score, average='macro'),
-    make_scorer(f1_score, average='macro'),
-]:
-    clf = Classifier()
-    scores = cross_val_score(clf, xs, ys, scoring=scoring, cv=5, n_jobs=-1)
-    print(scoring, scores.mean())
-
-# save-model
-clf = Classifier().fit(xs, ys)
-joblib.dump(clf, path_model)
+
+@click.command()
+@click.option('--seed', type=int, default=0, help='Seed of the oversampling, the folds and the estimator')
+@click.option('--estimator', type=click.Choice(list(ESTIMATORS)), default='tree')
+@click.option('--cv', type=int, default=5, help='Number of folds')
+@click.option('--structure/--no-structure', default=True, help='Append the structural features (NaN where they failed)')
+def main(seed: int, estimator: str, cv: int, structure: bool) -> None:
+    rng = np.random.default_rng(seed)
+    xs: np.ndarray = np.load(root/'cache'/'xs.npy')
+    ys: np.ndarray = np.load(root/'cache'/'ys.npy')
+    if structure:
+        xs = np.hstack([xs, np.load(root/'cache'/'xs_structure.npy')])
+
+    # data-balance
+    keys = sorted(set(map(tuple, ys)))
+    ys = np.array(list(map(keys.index, map(tuple, ys))))
+    xs, ys = balance(xs, ys, rng)
+
+    # cross-validation (estimators that are parallel themselves get the cores instead of the folds)
+    tic = time.perf_counter()
+    scores = cross_validate(
+        ESTIMATORS[estimator](seed), xs, ys, scoring=SCORING, cv=cv,
+        n_jobs=-1 if estimator == 'tree' else None,
+    )
+    time_cv = time.perf_counter() - tic
+    for name in SCORING:
+        print(f'{name:>10} {scores[f"test_{name}"].mean():.6f} ± {scores[f"test_{name}"].std():.6f}')
+
+    # save-model
+    tic = time.perf_counter()
+    clf = ESTIMATORS[estimator](seed).fit(xs, ys)
+    time_fit = time.perf_counter() - tic
+    joblib.dump(clf, path_model)
+    print(f'{"cv/s":>10} {time_cv:.3f}')
+    print(f'{"fit/s":>10} {time_fit:.3f}')
+    peak_self, peak_worker = peak_memory()
+    print(f'{"peak/MiB":>10} {peak_self:.1f} (largest worker: {peak_worker:.1f})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+import math as m
+import pathlib as p
+import typing as t
+
+import numpy as np
+
+import columnar
+
+
+C = t.TypeVar('C')
+Metrics = t.Dict[str, t.Union[int, float]]
+Evaluate = t.Callable[..., t.List[t.Optional[Metrics]]]  # (candidates, timeout, number, **options)
+Pruned = t.Tuple[int, int, t.Optional[Metrics]]  # (index, rung, metrics at that rung)
+
+
+def rungs(timeout: float, number: int, eta: int = 3, count: int = 3, timeout_min: float = 1.0) -> t.List[t.Tuple[float, int]]:
+    '''(timeout, number) of every rung, cheapest first, the last one is the full-cost trial'''
+    return [
+        (min(timeout, max(timeout_min, timeout/eta**k)), max(1, number//eta**k))
+        for k in reversed(range(count))
+    ]
+
+
+def score(metrics: t.Optional[Metrics], rtol: float) -> float:
+    '''Lower is better: mean solve time of a converged trial, inf otherwise'''
+    if metrics is None or metrics['norm'] > rtol:
+        return m.inf
+    return metrics['time']
+
+
+def successive_halving(
+    evaluate: Evaluate, candidates: t.Sequence[C], timeout: float, number: int,
+    eta: int = 3, count: int = 3, **options: t.Any,
+) -> t.Tuple[t.List[t.Optional[Metrics]], t.List[Pruned]]:
+    '''Successive halving over `candidates`
+
+    Every rung evaluates the surviving candidates with fewer repetitions and a
+    shorter timeout, and promotes the best `1/eta` of the converged ones. The
+    returned metrics are those of the full-cost rung; pruned candidates are None
+    there and listed with the rung they were dropped at, so callers can tell them
+    apart from candidates that failed at full cost.
+    '''
+    rtol = options.get('ksp_rtol', m.inf)
+    alive = list(range(len(candidates)))
+    ans: t.List[t.Optional[Metrics]] = [None] * len(candidates)
+    pruned: t.List[Pruned] = []
+    schedule = rungs(timeout, number, eta, count)
+    for rung, (timeout_rung, number_rung) in enumerate(schedule):
+        metricss = evaluate([candidates[ith] for ith in alive], timeout_rung, number_rung, **options)
+        if rung == len(schedule) - 1:
+            for ith, metrics in zip(alive, metricss):
+                ans[ith] = metrics
+            break
+        scores = {ith: score(metrics, rtol) for ith, metrics in zip(alive, metricss)}
+        keep = set(sorted(
+            filter(lambda ith: m.isfinite(scores[ith]), alive), key=scores.__getitem__,
+        )[:max(1, m.ceil(len(alive)/eta))])
+        pruned.extend(
+            (ith, rung, metrics)
+            for ith, metrics in zip(alive, metricss) if ith not in keep
+        )
+        alive = [ith for ith in alive if ith in keep]
+        if not alive:
+            break
+    return ans, pruned
+
+
+def replay(
+    columns: columnar.Columns, rtol: float = 1e-7, timeout: float = 10.0, number: int = 100,
+    eta: int = 3, count: int = 3, noise: float = 0.0, seed: int = 0,
+) -> t.Dict[str, float]:
+    '''Simulate `successive_halving` on recorded full-cost metrics
+
+    A trial is charged `min(time*number, timeout)` solver-seconds when it has
+    metrics and `timeout` otherwise. With `noise`, the times seen by the cheap
+    rungs get a log-normal error shrinking with the square root of `number`.
+    '''
+    rng = np.random.default_rng(seed)
+    table: t.Dict[str, t.Dict[t.Tuple[str, str], t.Optional[Metrics]]] = {}
+    for ith in range(len(columns['path'])):
+        option = columns['ksp_type'][ith], columns['pc_type'][ith]
+        metrics = {key: columns[key][ith].item() for key in columnar.METRICS} if columns['valid'][ith] else None
+        table.setdefault(columns['path'][ith], {}).setdefault(option, metrics)
+    cost = {'exhaustive': 0.0, 'adaptive': 0.0}
+    agree, regret, total = 0, 0.0, 0
+    for trials in table.values():
+        def evaluate(candidates: t.List[t.Tuple[str, str]], timeout_rung: float, number_rung: int, **options: t.Any) -> t.List[t.Optional[Metrics]]:
+            ans = []
+            for candidate in candidates:
+                metrics = trials[candidate]
+                cost['adaptive'] += timeout_rung if metrics is None else min(metrics['time']*number_rung, timeout_rung)
+                if metrics is not None and noise and number_rung < number:
+                    sigma = noise * m.sqrt(number/number_rung)
+                    metrics = {**metrics, 'time': metrics['time']*rng.lognormal(0.0, sigma)}
+                ans.append(metrics)
+            return ans
+        candidates = list(trials)
+        cost['exhaustive'] += sum(
+            timeout if metrics is None else min(metrics['time']*number, timeout)
+            for metrics in trials.values()
+        )
+        metricss, _ = successive_halving(evaluate, candidates, timeout, number, eta, count, ksp_rtol=rtol)
+        best = min(candidates, key=lambda candidate: score(trials[candidate], rtol))
+        if not m.isfinite(score(trials[best], rtol)):
+            continue
+        found = min(range(len(candidates)), key=lambda ith: score(metricss[ith], rtol))
+        agree += candidates[found] == best
+        regret += trials[candidates[found]]['time'] / trials[best]['time'] if metricss[found] else m.inf
+        total += 1
+    return {
+        'matrices': total,
+        'agreement': agree / max(1, total),
+        'regret': regret / max(1, total),  # mean time of the found winner over the true one
+        'exhaustive/s': cost['exhaustive'],
+        'adaptive/s': cost['adaptive'],
+        'speed-up': cost['exhaustive'] / max(cost['adaptive'], 1e-12),
+    }
+
+
+if __name__ == '__main__':
+    root = p.Path(__file__).parent
+    path = root / 'metrics.npz'
+    columns = columnar.load(path) if path.exists() else columnar.tsv2columns(root/'metrics.tsv')
+    for noise in [0.0, 0.1, 0.3]:
+        print(f'noise={noise}', replay(columns, noise=noise))
@@ -0,0 +1,53 @@
+import ast
+import pathlib as p
+import typing as t
+
+import numpy as np
+
+
+Columns = t.Dict[str, np.ndarray]
+
+OPTIONS = ('ksp_type', 'pc_type')
+METRICS = {'iter': np.int64, 'mem': np.float64, 'norm': np.float64, 'time': np.float64}
+
+
+def tsv2columns(path: p.Path) -> Columns:
+    '''Parse `metrics.tsv` (repr-encoded cells) into typed columns
+
+    Rows whose options or metrics are `None` are kept with `valid == False`,
+    blank separator lines are dropped.
+    '''
+    paths, options, metrics, valid = [], {key: [] for key in OPTIONS}, {key: [] for key in METRICS}, []
+    with open(path, 'r') as file:
+        file.readline()
+        for line in map(str.strip, file):
+            if not line:
+                continue
+            part, *others = line.split('\t')
+            option, metric = map(ast.literal_eval, others)
+            paths.append(part)
+            valid.append(option is not None and metric is not None)
+            for key in OPTIONS:
+                options[key].append((option or {}).get(key, ''))
+            for key in METRICS:
+                metrics[key].append((metric or {}).get(key, 0))
+    return {
+        'path': np.array(paths, dtype=np.str_),
+        **{key: np.array(val, dtype=np.str_) for key, val in options.items()},
+        **{key: np.array(val, dtype=METRICS[key]) for key, val in metrics.items()},
+        'valid': np.array(valid, dtype=np.bool_),
+    }
+
+
+def save(path: p.Path, columns: Columns) -> None:
+    np.savez(path, **columns)
+
+
+def load(path: p.Path) -> Columns:
+    with np.load(path, allow_pickle=False) as npz:
+        return dict(npz)
+
+
+if __name__ == '__main__':
+    root = p.Path(__file__).parent
+    save(root/'metrics.npz', tsv2columns(root/'metrics.tsv'))
@@ -1,14 +1,29 @@
-import ast
+import concurrent.futures as cf
+import contextlib as cl
+import functools as f
 import itertools as it
+import math as m
+import os
 import pathlib as p
+import queue
+import selectors
+import signal
 import subprocess as sp
+import time
 import typing as t
 
+import click
 import tqdm
+import typing_extensions as te
 
+from adaptive import Evaluate, Pruned, successive_halving
 
+
+T = t.TypeVar('T')
+Cpus = t.Set[int]
 Number = t.Union[int, float]
 Metrics = t.Dict[str, Number]
+Options = t.Dict[str, str]
 
 
 def txt2bin(src: p.Path, dst: p.Path) -> bool:
@@ -19,74 +34,314 @@ def txt2bin(src: p.Path, dst: p.Path) -> bool:
     return cp.returncode == 0
 
 
-def test4solve(path: p.Path, timeout: float, number: int = 1000, **options: str) -> t.Optional[Metrics]:
+def pin(cpus: t.Optional[Cpus]) -> t.Optional[t.Callable[[], None]]:
+    '''`preexec_fn` confining the child to `cpus` before it execs, so every thread it starts inherits them'''
+    return None if cpus is None else f.partial(os.sched_setaffinity, 0, cpus)
+
+
+def test4solve(
+    path: p.Path, timeout: float, number: int = 1000, cpus: t.Optional[Cpus] = None, **options: str,
+) -> t.Optional[Metrics]:
     extras = [[f'-{key}', str(val)] for key, val in options.items()]
+    env = None if cpus is None else {**os.environ, 'OMP_NUM_THREADS': str(len(cpus))}
     try:
-        cp = sp.run([
+        # own session, so that a timeout kills the whole process group
+        process = sp.Popen([
             'test4solve', '--A', path.as_posix(), '--number', str(number),
             *it.chain(*extras),
-        ], capture_output=True, timeout=timeout)
-        if cp.returncode != 0:
+        ], stdout=sp.PIPE, stderr=sp.PIPE, env=env, start_new_session=True, preexec_fn=pin(cpus))
+        try:
+            stdout, _ = process.communicate(timeout=timeout)
+        except sp.TimeoutExpired:
+            with cl.suppress(OSError):
+                os.killpg(process.pid, signal.SIGKILL)
+            process.communicate()
             return None
-        func = lambda key, val: (key, ast.literal_eval(val))  # inf
-        return dict(
-            func(*line.split('\t'))
-            for line in cp.stdout.decode().splitlines()
-        )
+        if process.returncode != 0:
+            return None
+        return parse(stdout.decode())
     except Exception:
         return None
 
 
+def parse(stdout: str) -> Metrics:
+    '''Typed metrics printed by `test4solve`, non-finite values (inf, nan) are rejected'''
+    ans = {}
+    for line in stdout.splitlines():
+        key, val = line.split('\t')
+        number = int(val) if val.lstrip('-').isdigit() else float(val)
+        if not m.isfinite(number):
+            raise ValueError(f'{key} = {val}')
+        ans[key] = number
+    return ans
+
+
+class Worker:
+    '''Client of a long-lived `test4solve --serve` process that keeps one matrix loaded
+
+    Each option set is sent as one line on stdin and answered by the usual metric
+    lines followed by `end`; a timed out or crashed worker is killed and restarted
+    lazily by the next `solve`. Loading the matrix, up to `ready`, has its own
+    `timeout` and does not count against the first solve.
+    '''
+
+    def __init__(self, path: p.Path, cpus: t.Optional[Cpus] = None, command: t.Sequence[str] = ('test4solve',)) -> None:
+        self._args = [*command, '--A', path.as_posix(), '--serve']
+        self._cpus = cpus
+        self._process: t.Optional[sp.Popen] = None
+        self._buffer = b''
+
+    def __enter__(self) -> te.Self:
+        return self
+
+    def __exit__(self, *args: t.Any) -> None:
+        self.close()
+
+    def solve(self, timeout: float, number: int = 1000, **options: str) -> t.Optional[Metrics]:
+        try:
+            process = self._start(timeout)
+            deadline = time.monotonic() + timeout
+            extras = [f'-{key} {val}' for key, val in options.items()]
+            process.stdin.write(' '.join([f'--number {number}', *extras]).encode() + b'\n')
+            process.stdin.flush()
+            lines = []
+            while (line := self._readline(deadline)) != 'end':
+                lines.append(line)
+            if any(line.startswith('error\t') for line in lines):
+                return None
+            return parse('\n'.join(lines))
+        except Exception:  # timeout, crash or unparsable answer
+            self.close()
+            return None
+
+    def solve_all(self, optionss: t.List[Options], timeout: float, number: int = 1000, **options: str) -> t.List[t.Optional[Metrics]]:
+        return [self.solve(timeout, number, **options, **others) for others in optionss]
+
+    def close(self) -> None:
+        if self._process is not None:
+            with cl.suppress(OSError):
+                os.killpg(self._process.pid, signal.SIGKILL)
+            self._process.communicate()
+            self._process, self._buffer = None, b''
+
+    def _start(self, timeout: float) -> sp.Popen:
+        if self._process is None:
+            env = None if self._cpus is None else {**os.environ, 'OMP_NUM_THREADS': str(len(self._cpus))}
+            self._process = sp.Popen(
+                self._args, stdin=sp.PIPE, stdout=sp.PIPE, stderr=sp.DEVNULL,
+                env=env, start_new_session=True, preexec_fn=pin(self._cpus),
+            )
+            if self._readline(time.monotonic()+timeout) != 'ready':
+                raise EOFError
+        return self._process
+
+    def _readline(self, deadline: float) -> str:
+        fd = self._process.stdout.fileno()
+        with selectors.DefaultSelector() as selector:
+            selector.register(fd, selectors.EVENT_READ)
+            while b'\n' not in self._buffer:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not selector.select(remaining):
+                    raise TimeoutError
+                chunk = os.read(fd, 1 << 16)
+                if not chunk:
+                    raise EOFError
+                self._buffer += chunk
+        line, self._buffer = self._buffer.split(b'\n', maxsplit=1)
+        return line.decode()
+
+
+class Scheduler:
+    '''Worker pool whose workers each own a disjoint set of `cores` CPUs'''
+
+    def __init__(self, jobs: int = 1, cores: int = 1) -> None:
+        available = sorted(os.sched_getaffinity(0))
+        cores = max(1, min(cores, len(available)))
+        self._jobs = max(1, min(jobs, len(available)//cores))
+        self._slots: 'queue.Queue[Cpus]' = queue.Queue()
+        for ith in range(self._jobs):
+            self._slots.put(set(available[ith*cores:(ith+1)*cores]))
+
+    def map(self, func: t.Callable[..., T], kwargs: t.Iterable[t.Dict[str, t.Any]]) -> t.Iterator[T]:
+        '''Call `func(cpus=..., **kw)` for every `kw`, results keep the input order'''
+        with cf.ThreadPoolExecutor(max_workers=self._jobs) as executor:
+            yield from executor.map(lambda kw: self._call(func, kw), kwargs)
+
+    def _call(self, func: t.Callable[..., T], kwargs: t.Dict[str, t.Any]) -> T:
+        cpus = self._slots.get()
+        try:
+            return func(cpus=cpus, **kwargs)
+        finally:
+            self._slots.put(cpus)
+
+
 class TSV:
+    '''Append-only TSV table with an in-memory index, loaded once and kept in sync on append
+
+    Rows are buffered and written with a single `os.write` on an `O_APPEND` descriptor,
+    followed by one `fsync` per `batch` rows; a torn last line is dropped on load.
+    '''
 
-    def __init__(self, path: str, columns: t.List[str]) -> None:
+    def __init__(self, path: str, columns: t.List[str], keys: int = 1, batch: int = 64) -> None:
         self._path = p.Path(path)
-        if not self._path.exists():
+        self._keys = keys
+        self._batch = batch
+        self._buffer: t.List[str] = []
+        self._cells: t.Set[str] = set()
+        self._rows: t.Dict[t.Tuple[str, ...], t.List[str]] = {}
+        if self._path.exists():
+            self._load()
+        else:
             self._path.parent.mkdir(parents=True, exist_ok=True)
             self._append(columns)
+            self.flush()
 
     def __contains__(self, key: str) -> bool:
-        with open(self._path, 'r') as f:
-            for line in f:
-                if key in line.strip().split('\t'):
-                    return True
-        return False
+        return key in self._cells
+
+    def __enter__(self) -> te.Self:
+        return self
+
+    def __exit__(self, *args: t.Any) -> None:
+        self.flush()
+
+    def get(self, *keys: str) -> t.Optional[t.List[str]]:
+        '''Remaining cells of the last row whose leading cells are `keys`'''
+        return self._rows.get(keys)
 
     def append(self, *parts: str) -> None:
         self._append(parts)
+        if len(self._buffer) >= self._batch:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+        fd = os.open(self._path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+        try:
+            os.write(fd, ''.join(self._buffer).encode())
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self._buffer.clear()
 
     def _append(self, parts: t.Iterable[str]) -> None:
-        with open(self._path, 'a+') as f:
-            f.write('\t'.join(map(str, parts)) + '\n')
+        cells = list(map(str, parts))
+        self._buffer.append('\t'.join(cells) + '\n')
+        self._index(cells)
+
+    def _index(self, cells: t.List[str]) -> None:
+        self._cells.update(cells)
+        if len(cells) > self._keys:
+            self._rows[tuple(cells[:self._keys])] = cells[self._keys:]
+
+    def _load(self) -> None:
+        with open(self._path, 'r+') as f:
+            text = f.read()
+            if text and not text.endswith('\n'):  # torn write
+                text = text[:text.rfind('\n')+1]
+                f.truncate(len(text.encode()))
+        for line in text.splitlines():
+            self._index(line.strip().split('\t'))
 
 
 root = p.Path(__file__).parent
 dir_src = root.parents[1] / 'training-dataset' / 'foam2mtx' / 'cache' / 'mtx' / '10'
 dir_dst = root / 'cache'
-tsv = TSV(root/'metrics.tsv', ['path', 'options', 'metrics'])
 default = {'timeout': 100*0.1, 'number': 100, 'ksp_rtol': 1e-7}
 ksp_types = {'richardson', 'chebyshev', 'cg', 'gmres', 'bicg'}
 pc_types = {'none', 'jacobi', 'lu', 'asm', 'ilu', 'gamg'}
 
-dir_dst.mkdir(parents=True, exist_ok=True)
-paths = list(dir_src.rglob('0'))
-for path_src in tqdm.tqdm(paths):
-    if not path_src.is_file():
-        continue
-    key = path_src.relative_to(dir_src).as_posix()
-    path_dst = dir_dst / key
-    if key in tsv:
-        continue
-    # txt2bin
+
+def prepare(path_src: p.Path) -> t.Optional[p.Path]:
+    '''Binary matrix of `path_src` for test4solve, None if txt2bin fails'''
+    path_dst = dir_dst / path_src.relative_to(dir_src)
     if not path_dst.exists():
         path_dst.parent.mkdir(parents=True, exist_ok=True)
         if not txt2bin(path_src, path_dst):
-            tsv.append(key, 'None', 'None')
+            return None
+    return path_dst
+
+
+def test4solve_all(
+    scheduler: 'Scheduler', path: p.Path, optionss: t.List[Options], timeout: float, number: int = 1000, **options: str,
+) -> t.List[t.Optional[Metrics]]:
+    '''Same as `Worker.solve_all`, but one process per option set, spread over `scheduler`'''
+    return list(scheduler.map(test4solve, (
+        {'path': path, 'timeout': timeout, 'number': number, **options, **others}
+        for others in optionss
+    )))
+
+
+def search(evaluate: Evaluate, optionss: t.List[Options], eta: t.Optional[int] = None) -> t.Tuple[t.List[t.Optional[Metrics]], t.List[Pruned]]:
+    '''All option sets at full cost, or successive halving with factor `eta`'''
+    if eta is None:
+        return evaluate(optionss, **default), []
+    return successive_halving(evaluate, optionss, eta=eta, **default)
+
+
+def label(
+    path_src: p.Path, optionss: t.List[Options], eta: t.Optional[int] = None, cpus: t.Optional[Cpus] = None,
+) -> t.Optional[t.Tuple[t.List[t.Optional[Metrics]], t.List[Pruned]]]:
+    '''All trials of one matrix through a single `Worker`, None if txt2bin fails'''
+    path_dst = prepare(path_src)
+    if path_dst is None:
+        return None
+    with Worker(path_dst, cpus) as worker:
+        return search(worker.solve_all, optionss, eta)
+
+
+@click.command()
+@click.option('--jobs', type=int, default=1, help='Number of concurrent solver trials')
+@click.option('--cores', type=int, default=1, help='Number of cores pinned to each trial')
+@click.option('--daemon/--no-daemon', default=False, help='Load each matrix once into a long-lived test4solve')
+@click.option('--adaptive', type=click.IntRange(min=2), default=None, help='Successive halving with this reduction factor (at least 2)')
+def main(jobs: int, cores: int, daemon: bool, adaptive: t.Optional[int]) -> None:
+    '''Label every matrix with the metrics of all solver options'''
+    with \
+        TSV(root/'metrics.tsv', ['path', 'options', 'metrics'], keys=2) as tsv, \
+        TSV(root/'pruned.tsv', ['path', 'options', 'rung', 'metrics'], keys=2) as pruned_tsv:
+        scheduler = Scheduler(jobs, cores)
+        dir_dst.mkdir(parents=True, exist_ok=True)
+        optionss: t.List[Options] = [
+            {'ksp_type': ksp_type, 'pc_type': pc_type}
+            for ksp_type, pc_type in it.product(ksp_types, pc_types)
+        ]
+        paths = [
+            path_src for path_src in dir_src.rglob('0')
+            if path_src.is_file() and path_src.relative_to(dir_src).as_posix() not in tsv
+        ]
+        if daemon:
+            # matrices are spread over the pool, each one served by a single worker
+            results = scheduler.map(label, (
+                {'path_src': path, 'optionss': optionss, 'eta': adaptive}
+                for path in paths
+            ))
+        else:
+            # trials of one matrix are spread over the pool
+            results = (
+                None if path_dst is None else search(f.partial(test4solve_all, scheduler, path_dst), optionss, adaptive)
+                for path_dst in map(prepare, paths)
+            )
+        for path_src, result in zip(paths, tqdm.tqdm(results, total=len(paths))):
+            key = path_src.relative_to(dir_src).as_posix()
+            if result is None:
+                tsv.append(key, 'None', 'None')
+            else:
+                metricss, pruned = result
+                # pruned trials only go to pruned.tsv, so None in metrics.tsv always means a failed trial
+                dropped = {ith for ith, _, _ in pruned}
+                kept = [ith for ith in range(len(optionss)) if ith not in dropped]
+                for ith in kept:
+                    tsv.append(key, repr(optionss[ith]), repr(metricss[ith]))
+                if not kept:  # nothing converged at a cheap rung: no label, but the matrix is done
+                    tsv.append(key, 'None', 'None')
+                for ith, rung, metrics in pruned:
+                    pruned_tsv.append(key, repr(optionss[ith]), rung, repr(metrics))
             tsv.append()
-            continue
-    # test4solve
-    for ksp_type, pc_type in it.product(ksp_types, pc_types):
-        options = {'ksp_type': ksp_type, 'pc_type': pc_type}
-        metrics = test4solve(path_dst, **default, **options)
-        tsv.append(key, repr(options), repr(metrics))
-    tsv.append()
+            pruned_tsv.flush()
+            tsv.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -8,32 +8,48 @@
 #include <petscvec.h>
 #include <petscviewer.h>
 #include <petscviewertypes.h>
+#include <stdio.h>
+#include <string.h>
 
 #include "util.h"
 
+#define LINE_LENGTH 4096
+
 static const PetscChar help[] =
     "Test for KSPSolve (Ax=b)\n"
     "\n"
     "Options:\n"
     "  --A       TEXT     A matrix path\n"
-    "  --number  INTEGER  Perform exactly number runs\n";
+    "  --number  INTEGER  Perform exactly number runs\n"
+    "  --serve            Keep A loaded (\"ready\" once it is) and read one line\n"
+    "                     of options per solve from stdin, each answer ends\n"
+    "                     with \"end\"\n";
 
 typedef struct {
     PetscChar a[PETSC_MAX_PATH_LEN];
     PetscInt number;
+    PetscBool serve;
     // flags
     PetscBool flag_a;
 } AppCtx;
 
 PetscErrorCode user_init_options(AppCtx *);
-PetscErrorCode user_solve(AppCtx *);
+PetscErrorCode user_load(AppCtx *, Mat *, Vec *, Vec *);
+PetscErrorCode user_solve(AppCtx *, Mat, Vec, Vec);
+PetscErrorCode user_serve(AppCtx *, Mat, Vec, Vec);
 
 int main(int argc, char **args) {
-    AppCtx user;
+    AppCtx user = {0};  // options that are not given stay off
+    Mat a;
+    Vec b, x;
     PetscCall(
            PetscInitialize(&argc, &args, (char *)0, help)
         || user_init_options(&user)
-        || user_solve(&user)
+        || user_load(&user, &a, &b, &x)
+        || (user.serve ? user_serve(&user, a, b, x) : user_solve(&user, a, b, x))
+        || VecDestroy(&x)
+        || VecDestroy(&b)
+        || MatDestroy(&a)
         || PetscFinalize()
     );
     return 0;
@@ -43,6 +59,7 @@ PetscErrorCode user_init_options(AppCtx *ctx) {
     PetscCall(
            user_options_get_path("--A", ctx->a, &ctx->flag_a)
         || user_options_get_integer_default("--number", &ctx->number, 1000)
+        || user_options_get_boolean_default("--serve", &ctx->serve)
     );
     // a
     if (!ctx->flag_a) {
@@ -52,29 +69,30 @@ PetscErrorCode user_init_options(AppCtx *ctx) {
     return PETSC_SUCCESS;
 }
 
-PetscErrorCode user_solve(AppCtx *ctx) {
-    KSP ksp;
-    Mat a;
+PetscErrorCode user_load(AppCtx *ctx, Mat *a, Vec *b, Vec *x) {
+    PetscInt size;
+    PetscViewer viewer;
+    return PetscViewerBinaryOpen(PETSC_COMM_WORLD, ctx->a, FILE_MODE_READ, &viewer)
+        || MatCreate(PETSC_COMM_WORLD, a)
+        || MatLoad(*a, viewer)
+        || PetscViewerDestroy(&viewer)
+        || MatGetSize(*a, &size, PETSC_NULLPTR)
+        || VecCreate(PETSC_COMM_WORLD, x)
+        || VecSetFromOptions(*x)
+        || VecSetSizes(*x, size, PETSC_DETERMINE)
+        || VecSet(*x, 1.0)
+        || VecDuplicate(*x, b)
+        || MatMult(*a, *x, *b);
+}
+
+PetscErrorCode user_solve(AppCtx *ctx, Mat a, Vec b, Vec x) {
+    KSP ksp = PETSC_NULLPTR;
     PC pc;
-    PetscInt its, size;
+    PetscInt its;
     PetscLogDouble mems = 0.0, times = 0.0, mem, tic, toc;
     PetscReal rnorm;
-    PetscViewer viewer;
-    Vec b, x, x0;
+    Vec x0 = PETSC_NULLPTR;
     PetscErrorCode ierr = PETSC_SUCCESS;
-    // load
-    ierr = ierr
-        || PetscViewerBinaryOpen(PETSC_COMM_WORLD, ctx->a, FILE_MODE_READ, &viewer)
-        || MatCreate(PETSC_COMM_WORLD, &a)
-        || MatLoad(a, viewer)
-        || PetscViewerDestroy(&viewer)
-        || MatGetSize(a, &size, PETSC_NULLPTR)
-        || VecCreate(PETSC_COMM_WORLD, &x)
-        || VecSetFromOptions(x)
-        || VecSetSizes(x, size, PETSC_DETERMINE)
-        || VecSet(x, 1.0)
-        || VecDuplicate(x, &b)
-        || MatMult(a, x, b);
     // solve
     for (PetscInt ith = 0; ith < ctx->number; ith++) {
         ierr = ierr
@@ -97,7 +115,8 @@ PetscErrorCode user_solve(AppCtx *ctx) {
             mems += mem;
             times += tic - toc;
         }
-        ierr = ierr || KSPDestroy(&ksp);
+        // released every repetition: with --serve, one process runs many trials
+        ierr = KSPDestroy(&ksp) || VecDestroy(&x0) || ierr;
     }
     // post
     ierr = ierr
@@ -105,9 +124,26 @@ PetscErrorCode user_solve(AppCtx *ctx) {
         || PetscPrintf(PETSC_COMM_WORLD, "mem\t%le\n", mems/ctx->number)
         || PetscPrintf(PETSC_COMM_WORLD, "norm\t%le\n", rnorm)
         || PetscPrintf(PETSC_COMM_WORLD, "time\t%le\n", times/ctx->number);
-    return ierr
-        || VecDestroy(&x0)
-        || VecDestroy(&x)
-        || VecDestroy(&b)
-        || MatDestroy(&a);
+    return ierr;
+}
+
+PetscErrorCode user_serve(AppCtx *ctx, Mat a, Vec b, Vec x) {
+    // one request per line, e.g. "--number 100 -ksp_type cg -pc_type jacobi"
+    PetscChar line[LINE_LENGTH];
+    PetscPrintf(PETSC_COMM_WORLD, "ready\n");  // A is loaded, requests are timed from here
+    fflush(PETSC_STDOUT);
+    while (fgets(line, LINE_LENGTH, stdin) && line[0] != '\n') {
+        line[strcspn(line, "\n")] = '\0';
+        if (
+               PetscOptionsClear(PETSC_NULLPTR)
+            || PetscOptionsInsertString(PETSC_NULLPTR, line)
+            || user_options_get_integer_default("--number", &ctx->number, 1000)
+            || user_solve(ctx, a, b, x)
+        ) {
+            PetscPrintf(PETSC_COMM_WORLD, "error\t1\n");
+        }
+        PetscPrintf(PETSC_COMM_WORLD, "end\n");
+        fflush(PETSC_STDOUT);
+    }
+    return PETSC_SUCCESS;
 }
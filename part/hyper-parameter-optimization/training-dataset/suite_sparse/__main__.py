@@ -11,22 +11,28 @@ def cli() -> None:
 @cli.command()
 @click.option('--byte-min', type=int, default=0)
 @click.option('--byte-max', type=int, default=20050815)
-def init(byte_min: int, byte_max: int) -> None:
+@click.option('--jobs', type=int, default=1, help='Number of concurrent downloads')
+@click.option('--stream/--no-stream', default=False, help='Extract from the response without staging archives')
+def init(byte_min: int, byte_max: int, jobs: int, stream: bool) -> None:
     '''Initialize data directory'''
     SuiteSparseMatrixCollection \
         .fromHttp() \
         .update_data(
             overwrite=False,
             filter_kwargs={'byte_min': byte_min, 'byte_max': byte_max},
+            jobs=jobs,
+            stream=stream,
         )
 
 @cli.command()
 @click.option('--shape', type=int, default=1024)
-def spy(shape) -> None:
+@click.option('--jobs', type=int, default=1, help='Number of rendering processes')
+@click.option('--cache/--no-cache', default=False, help='Load matrices through the binary CSR cache (parsed with scipy, stored as .npy)')
+def spy(shape: int, jobs: int, cache: bool) -> None:
     '''Visualize sparsity pattern of matrix'''
     SuiteSparseMatrixCollection \
         .fromHttp() \
-        .spy(shape=shape, overwrite=False)
+        .spy(shape=shape, overwrite=False, jobs=jobs, cache=cache)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,61 @@
+import pathlib as p
+import tempfile
+import time
+import typing as t
+
+import numpy as np
+
+from math import ceil
+
+from .image import SYMMETRIES, sparsity
+from .type import Path
+
+
+def sparsity_loop(path: Path, shape: t.Optional[int] = None) -> np.ndarray:
+    '''Reference per-line implementation that `image.sparsity` replaced'''
+    with open(path, 'r') as file:
+        symmetric = file.readline().split()[4] in SYMMETRIES
+        while True:
+            line = file.readline()
+            if not line.startswith('%'):
+                break
+        size, _, nz = map(int, line.split())
+        shape, delta = (size, 1.0) if shape is None else (shape, size/shape)
+        image = np.zeros((shape, shape), dtype=np.bool_)
+        for _ in range(nz):
+            ith, jth = map(int, file.readline().split()[:2])
+            image[ceil(ith/delta)-1, ceil(jth/delta)-1] = True
+    if symmetric:
+        image |= image.T
+    return image
+
+
+def synthetic(path: p.Path, size: int, nz: int, symmetry: str = 'general', seed: int = 0) -> p.Path:
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(1, size+1, nz)
+    cols = rng.integers(1, size+1, nz)
+    if symmetry != 'general':
+        rows, cols = np.maximum(rows, cols), np.minimum(rows, cols)
+    with open(path, 'w') as file:
+        file.write(f'%%MatrixMarket matrix coordinate real {symmetry}\n% synthetic\n{size} {size} {nz}\n')
+        np.savetxt(file, np.column_stack([rows, cols, rng.random(nz)]), fmt=['%d', '%d', '%.6e'])
+    return path
+
+
+def benchmark(nzs: t.Iterable[int] = (10**4, 10**5, 10**6), size: int = 100_000, shape: int = 512) -> None:
+    print(f'{"nnz":>10} {"symmetry":>10} {"loop/s":>10} {"vector/s":>10} {"speed-up":>10}')
+    with tempfile.TemporaryDirectory() as directory:
+        for nz in nzs:
+            for symmetry in ['general', 'symmetric']:
+                path = synthetic(p.Path(directory)/f'{nz}.mtx', size, nz, symmetry)
+                tic = time.perf_counter()
+                expected = sparsity_loop(path, shape)
+                toc = time.perf_counter()
+                actual = sparsity(path, shape)
+                tac = time.perf_counter()
+                assert np.array_equal(expected, actual)
+                print(f'{nz:>10} {symmetry:>10} {toc-tic:>10.3f} {tac-toc:>10.3f} {(toc-tic)/(tac-toc):>10.1f}')
+
+
+if __name__ == '__main__':
+    benchmark()
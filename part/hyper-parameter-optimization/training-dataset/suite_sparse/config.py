@@ -4,7 +4,13 @@ import pathlib as p
 ROOT = p.Path(__file__).absolute().parent
 
 CACHE = ROOT / 'cache'
+CSR = CACHE / 'csr'
 DATA = CACHE / 'data'
 META = CACHE / 'meta.json'
+SIZE = CACHE / 'size.json'
 SPY = CACHE / 'spy'
+SPY_TIMING = CACHE / 'spy.tsv'
 ZIP = CACHE / 'zip'
+
+PROXY = 'http://localhost:20171'
+RATE = 4.0  # requests per second per host
@@ -1,87 +1,160 @@
+import concurrent.futures as cf
 import io
 import json
 import pathlib as p
+import shutil
 import tarfile
+import threading
 import typing as t
 
-import matplotlib.pyplot as plt
-import numpy as np
 import requests
 import tqdm
 import typing_extensions as te
 
-from math import ceil
 from urllib.parse import urlsplit
 
 from bs4 import BeautifulSoup
 
-from .config import DATA, META, SPY, ZIP
+from .config import CSR, DATA, META, PROXY, RATE, SIZE, SPY, SPY_TIMING, ZIP
+from .download import Downloader
+from .image import render
 from .type import DictStr, Func0, Kwargs, Strings
 from .util import mkdir
 
 
 class SuiteSparseMatrixCollection:
-    def __init__(self, https: bool = True) -> None:
+    def __init__(self, https: bool = True, proxy: t.Optional[str] = PROXY, rate: t.Optional[float] = RATE) -> None:
         self._scheme = 'https://' if https else 'http://'
+        self._downloader = Downloader(rate=rate, proxy=proxy)
         self._links = json.loads(META.read_text()) if META.exists() else self._meta()
+        self._sizes: DictStr[t.Optional[int]] = json.loads(SIZE.read_text()) if SIZE.exists() else {}
+        self._lock = threading.Lock()
 
     @classmethod
-    def fromHttp(cls) -> te.Self:
-        return cls(https=False)
-
-    def update_data(self, overwrite: bool = False, filter_kwargs: DictStr = {}) -> te.Self:
-        for link in tqdm.tqdm(self._links):
-            parts = urlsplit(link)
-            path = p.Path(parts.path).relative_to('/MM/')
-            self._try(
-                lambda: self._data_download(parts.netloc+parts.path, path, overwrite),
-                lambda: self._data_filter(path, **filter_kwargs),
-                lambda: self._data_extract(path, overwrite),
-            )
+    def fromHttp(cls, **kwargs: Kwargs) -> te.Self:
+        return cls(https=False, **kwargs)
+
+    def update_data(
+        self,
+        overwrite: bool = False, filter_kwargs: DictStr = {}, jobs: int = 1, stream: bool = False,
+    ) -> te.Self:
+        try:
+            with cf.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+                futures = [
+                    executor.submit(self._update_data, link, overwrite, filter_kwargs, stream)
+                    for link in self._links
+                ]
+                for _ in tqdm.tqdm(cf.as_completed(futures), total=len(futures)):
+                    pass
+        finally:
+            mkdir(SIZE, parent=True).write_text(json.dumps(self._sizes))
         return self
 
     def update_meta(self) -> te.Self:
         self._links = self._meta()
         return self
 
-    def spy(self, shape: t.Optional[int] = None, overwrite: bool = False) -> te.Self:
+    def spy(self, shape: t.Optional[int] = None, overwrite: bool = False, jobs: int = 1, cache: bool = False) -> te.Self:
         mkdir(SPY)
-        for path in tqdm.tqdm(list(DATA.rglob('*.mtx'))):
-            self._spy(path, shape, overwrite)
+        csr = mkdir(CSR) if cache else None
+        tasks = [
+            (src, dst) for src, dst in map(lambda src: (src, self._spy_path(src)), DATA.rglob('*.mtx'))
+            if overwrite or not dst.exists()
+        ]
+        tasks.sort(key=lambda task: task[0].stat().st_size, reverse=True)  # largest first
+        with cf.ProcessPoolExecutor(max_workers=max(1, jobs)) as executor, open(SPY_TIMING, 'a') as file:
+            futures = {executor.submit(render, src, dst, shape, csr): src for src, dst in tasks}
+            for future in tqdm.tqdm(cf.as_completed(futures), total=len(futures)):
+                src = futures[future]
+                file.write(f'{src.relative_to(DATA).as_posix()}\t{src.stat().st_size}\t{future.result()}\n')
         return self
 
     def _get(self, url_without_scheme: str, **kwargs: Kwargs) -> requests.Response:
-        proxy = 'http://localhost:20171'
-        kwargs['proxies'] = {'http': proxy, 'https': proxy}
-        return requests.get(self._scheme+url_without_scheme, **kwargs)
+        return self._downloader.get(self._scheme+url_without_scheme, **kwargs)
 
     def _get_soup(self, url_without_scheme: str, **kwargs: Kwargs) -> BeautifulSoup:
         response = self._get(url_without_scheme, **kwargs)
         return BeautifulSoup(response.content, 'html.parser')
 
+    def _update_data(self, link: str, overwrite: bool, filter_kwargs: DictStr, stream: bool) -> None:
+        parts = urlsplit(link)
+        path = p.Path(parts.path).relative_to('/MM/')
+        if stream:
+            return self._try(
+                lambda: self._data_prefilter(parts.netloc+parts.path, path, **filter_kwargs),
+                lambda: self._data_stream(parts.netloc+parts.path, path, overwrite, **filter_kwargs),
+            )
+        self._try(
+            lambda: self._data_prefilter(parts.netloc+parts.path, path, **filter_kwargs),
+            lambda: self._data_download(parts.netloc+parts.path, path, overwrite),
+            lambda: self._data_filter(path, **filter_kwargs),
+            lambda: self._data_extract(path, overwrite),
+        )
+
     def _data_download(self, url: str, src: p.Path, overwrite: bool) -> None:
-        dst = ZIP / src
+        self._downloader.download(self._scheme+url, ZIP/src, overwrite)
+
+    def _data_extract(self, src: p.Path, overwrite: bool) -> None:
+        dst = mkdir(DATA / src.parent) / src.name.rsplit('.', maxsplit=2)[0]
         if not overwrite and dst.exists():
             return
-        mkdir(dst, parent=True).write_bytes(self._get(url).content)
+        with tarfile.TarFile.open(ZIP/src, 'r|gz') as tar:
+            self._extract(tar, dst)
 
-    def _data_extract(self, src: p.Path, overwrite: bool) -> None:
+    def _data_stream(self, url: str, src: p.Path, overwrite: bool, byte_min: int, byte_max: int) -> None:
+        '''Same as `_data_download` + `_data_filter` + `_data_extract`, but nothing is staged in `ZIP`'''
         dst = mkdir(DATA / src.parent) / src.name.rsplit('.', maxsplit=2)[0]
         if not overwrite and dst.exists():
             return
-        with tarfile.TarFile.open(ZIP/src, 'r:gz') as tar:
+        with self._downloader.open(self._scheme+url) as (file, size):
+            if size is not None and (byte_max <= size or size <= byte_min):
+                raise NotImplementedError
+            with tarfile.TarFile.open(fileobj=file, mode='r|gz') as tar:
+                self._extract(tar, dst)
+
+    def _extract(self, tar: tarfile.TarFile, dst: p.Path) -> None:
+        '''Unpack the `dst.name/` members of `tar` into `dst`, which only appears once `tar` is consumed
+
+        Members go to a hidden sibling first, so an interrupted download or a corrupt archive
+        never leaves a partial `dst` that later runs would take for a complete one.
+        '''
+        staging = dst.with_name(f'.{dst.name}.part')
+        shutil.rmtree(staging, ignore_errors=True)
+        try:
+            # single pass: the header is validated while the member is being written out
+            root = mkdir(staging).resolve()
             for info in tar:
                 if not info.isreg():
                     continue
+                path = (staging/info.name).resolve()
+                if not path.is_relative_to(root):
+                    continue
                 with tar.extractfile(info) as file:
-                    if self._check_mtx(file):
-                        tar.extract(info, dst.parent)
+                    header = self._check_mtx(file)
+                    if header is None:
+                        continue
+                    with open(mkdir(path, parent=True), 'wb') as out:
+                        out.write(header)
+                        shutil.copyfileobj(file, out)
+            if (staging/dst.name).is_dir():
+                shutil.rmtree(dst, ignore_errors=True)  # overwrite
+                (staging/dst.name).replace(dst)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
 
     def _data_filter(self, src: p.Path, byte_min: int, byte_max: int) -> None:
         size = (ZIP/src).stat().st_size
         if byte_max <= size or size <= byte_min:
             raise NotImplementedError
 
+    def _data_prefilter(self, url: str, src: p.Path, byte_min: int, byte_max: int) -> None:
+        '''Same as `_data_filter`, but with the size index, so no body is fetched'''
+        if (ZIP/src).exists():
+            return
+        size = self._size(url)
+        if size is not None and (byte_max <= size or size <= byte_min):
+            raise NotImplementedError
+
     def _meta(self) -> Strings:
         soup = self._get_soup('sparse.tamu.edu', params={'per_page': 'All'})
         links = [
@@ -91,38 +164,28 @@ class SuiteSparseMatrixCollection:
         mkdir(META, parent=True).write_text(json.dumps(links))
         return links
 
-    def _spy(self, src: p.Path, shape: t.Optional[int] = None, overwrite: bool = False) -> None:
-        dst = SPY / '+'.join(src.relative_to(DATA).with_suffix('.png').parts)
-        if not overwrite and dst.exists():
-            return
-        with open(src, 'r') as file:
-            symmetric = file.readline().split()[4] in {'symmetric', 'skew-symmetric', 'hermitian'}
-            while True:
-                line = file.readline()
-                if not line.startswith('%'):
-                    break
-            size, _, nz = map(int, line.split())  # row == col
-            shape, delta = (size, 1.0) if shape is None else (shape, size/shape)
-            image = np.zeros((shape, shape), dtype=np.bool_)
-            for _ in range(nz):
-                ith, jth = map(int, file.readline().split()[:2])
-                image[ceil(ith/delta)-1, ceil(jth/delta)-1] = True
-        if symmetric:
-            image |= image.T
-        self._imsave(dst, image)
-
-    def _check_mtx(self, file: io.BufferedReader) -> bool:
-        if file.readline().split()[:3] != [b'%%MatrixMarket', b'matrix', b'coordinate']:
-            return False
+    def _size(self, url_without_scheme: str) -> t.Optional[int]:
+        # archives on the server are immutable, so HEAD results are cached in `SIZE`
+        if url_without_scheme not in self._sizes:
+            size = self._downloader.size(self._scheme+url_without_scheme)
+            with self._lock:
+                self._sizes[url_without_scheme] = size
+        return self._sizes[url_without_scheme]
+
+    def _spy_path(self, src: p.Path) -> p.Path:
+        return SPY / '+'.join(src.relative_to(DATA).with_suffix('.png').parts)
+
+    def _check_mtx(self, file: io.BufferedReader) -> t.Optional[bytes]:
+        '''Consumed header lines if `file` is a square MatrixMarket coordinate matrix'''
+        lines = [file.readline()]
+        if lines[0].split()[:3] != [b'%%MatrixMarket', b'matrix', b'coordinate']:
+            return None
         while True:
-            line = file.readline()
-            if not line.startswith('%'):
+            lines.append(file.readline())
+            if not lines[-1].startswith(b'%'):
                 break
-        row, col = map(int, line.split()[:2])
-        return row == col
-
-    def _imsave(self, path: p.Path, matrix: np.ndarray) -> None:
-        plt.imsave(path, matrix, cmap='gray')
+        row, col = map(int, lines[-1].split()[:2])
+        return b''.join(lines) if row == col else None
 
     def _try(self, *funcs: Func0[None]) -> None:
         for func in funcs:
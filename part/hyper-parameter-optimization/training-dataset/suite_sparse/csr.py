@@ -0,0 +1,60 @@
+import hashlib
+import os
+import pathlib as p
+import shutil
+import typing as t
+
+import numpy as np
+
+from scipy.io import mmread
+from scipy.sparse import csr_matrix
+
+from .type import Path
+from .util import mkdir
+
+
+class CSRCache:
+    '''Content-hashed binary cache of MatrixMarket files
+
+    Every matrix is parsed once and stored as `data.npy`, `indices.npy`,
+    `indptr.npy` and `shape.npy` under `<root>/<sha256 of the text file>/`;
+    later loads memory-map those arrays, so they are lazy and zero-copy.
+    '''
+
+    _names = ('data', 'indices', 'indptr')
+
+    def __init__(self, root: Path) -> None:
+        self._root = p.Path(root)
+        self._digests: t.Dict[t.Tuple[str, int, int], str] = {}
+
+    def load(self, path: Path) -> csr_matrix:
+        directory = self._root / self.digest(path)
+        if not (directory/'shape.npy').exists():
+            self._dump(path, directory)
+        data, indices, indptr = (np.load(directory/f'{name}.npy', mmap_mode='r') for name in self._names)
+        shape = tuple(np.load(directory/'shape.npy').tolist())
+        return csr_matrix((data, indices, indptr), shape=shape, copy=False)
+
+    def digest(self, path: Path, chunk: int = 1 << 20) -> str:
+        path = p.Path(path).resolve()
+        stat = path.stat()
+        key = path.as_posix(), stat.st_size, stat.st_mtime_ns
+        if key not in self._digests:
+            sha256 = hashlib.sha256()
+            with open(path, 'rb') as file:
+                for block in iter(lambda: file.read(chunk), b''):
+                    sha256.update(block)
+            self._digests[key] = sha256.hexdigest()
+        return self._digests[key]
+
+    def _dump(self, src: Path, dst: p.Path) -> None:
+        # write into a private directory first, then publish it with a single rename
+        tmp = mkdir(dst.with_name(f'.{dst.name}.{os.getpid()}'))
+        matrix = csr_matrix(mmread(src))
+        for name in self._names:
+            np.save(tmp/f'{name}.npy', getattr(matrix, name))
+        np.save(tmp/'shape.npy', np.array(matrix.shape, dtype=np.int64))
+        try:
+            tmp.rename(dst)
+        except OSError:  # published concurrently by another process
+            shutil.rmtree(tmp, ignore_errors=True)
@@ -0,0 +1,95 @@
+import contextlib as cl
+import pathlib as p
+import threading
+import time
+import typing as t
+
+import requests
+
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+
+from .type import DictStr, Kwargs
+from .util import mkdir
+
+
+class Downloader:
+    '''Pooled, per-host rate limited and resumable HTTP downloader (thread-safe)'''
+
+    def __init__(
+        self,
+        pool: int = 16, rate: t.Optional[float] = None, proxy: t.Optional[str] = None,
+        chunk: int = 1 << 16, timeout: float = 60.0,
+    ) -> None:
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool, pool_maxsize=pool, max_retries=3)
+        for prefix in ['http://', 'https://']:
+            self._session.mount(prefix, adapter)
+        if proxy is not None:
+            self._session.proxies.update({'http': proxy, 'https': proxy})
+        self._rate = rate  # requests per second per host
+        self._chunk = chunk
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._next: DictStr[float] = {}
+
+    def get(self, url: str, **kwargs: Kwargs) -> requests.Response:
+        self._wait(url)
+        return self._session.get(url, **{'timeout': self._timeout, **kwargs})
+
+    def head(self, url: str, **kwargs: Kwargs) -> requests.Response:
+        self._wait(url)
+        return self._session.head(url, **{'timeout': self._timeout, 'allow_redirects': True, **kwargs})
+
+    def size(self, url: str) -> t.Optional[int]:
+        '''Content-Length reported by a HEAD request, without fetching the body'''
+        response = self.head(url)
+        response.raise_for_status()
+        length = response.headers.get('Content-Length', '')
+        return int(length) if length.isdigit() else None
+
+    def download(self, url: str, dst: p.Path, overwrite: bool = False) -> p.Path:
+        '''Stream `url` into `dst`, resuming from `dst.part` with an HTTP Range request'''
+        if not overwrite and dst.exists():
+            return dst
+        part = mkdir(dst.with_name(dst.name+'.part'), parent=True)
+        if overwrite and part.exists():
+            part.unlink()
+        offset = part.stat().st_size if part.exists() else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        with self.get(url, headers=headers, stream=True) as response:
+            if response.status_code == 416 and self._is_complete(response, offset):
+                return part.replace(dst)
+            response.raise_for_status()
+            mode = 'ab' if response.status_code == 206 else 'wb'  # server may ignore Range
+            with open(part, mode) as file:
+                for chunk in response.iter_content(self._chunk):
+                    file.write(chunk)
+        return part.replace(dst)
+
+    @cl.contextmanager
+    def open(self, url: str) -> t.Iterator[t.Tuple[t.BinaryIO, t.Optional[int]]]:
+        '''Raw response stream of `url` and its Content-Length, nothing is written to disk'''
+        with self.get(url, stream=True) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            length = response.headers.get('Content-Length', '')
+            yield response.raw, int(length) if length.isdigit() else None
+
+    def close(self) -> None:
+        self._session.close()
+
+    def _is_complete(self, response: requests.Response, offset: int) -> bool:
+        # Content-Range: bytes */<total>
+        total = response.headers.get('Content-Range', '').rpartition('/')[-1]
+        return total.isdigit() and int(total) == offset
+
+    def _wait(self, url: str) -> None:
+        if not self._rate:
+            return
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            at = max(now, self._next.get(host, now))
+            self._next[host] = at + 1.0/self._rate
+        time.sleep(at - now)
@@ -0,0 +1,83 @@
+import itertools as it
+import pathlib as p
+import struct
+import time
+import typing as t
+import zlib
+
+import numpy as np
+
+from scipy.sparse import csr_matrix
+
+from .csr import CSRCache
+from .type import Path
+
+
+SYMMETRIES = {'symmetric', 'skew-symmetric', 'hermitian'}
+
+
+def sparsity(path: Path, shape: t.Optional[int] = None, chunk: int = 1 << 20) -> np.ndarray:
+    '''Boolean sparsity image of a square MatrixMarket coordinate file
+
+    Entries are read `chunk` lines at a time and binned with array operations,
+    so memory is bounded by `chunk` rather than by the number of nonzeros.
+    '''
+    with open(path, 'r') as file:
+        symmetric = file.readline().split()[4] in SYMMETRIES
+        while True:
+            line = file.readline()
+            if not line.startswith('%'):
+                break
+        size, _, nz = map(int, line.split())  # row == col
+        shape, delta = (size, 1.0) if shape is None else (shape, size/shape)
+        image = np.zeros((shape, shape), dtype=np.bool_)
+        while nz > 0:
+            lines = list(it.islice(file, min(chunk, nz)))
+            if not lines:
+                break
+            nz -= len(lines)
+            indices = np.loadtxt(lines, dtype=np.int64, usecols=(0, 1), ndmin=2)
+            bins = np.ceil(indices/delta).astype(np.int64) - 1
+            image[bins[:, 0], bins[:, 1]] = True
+    if symmetric:
+        image |= image.T
+    return image
+
+
+def sparsity_csr(matrix: csr_matrix, shape: t.Optional[int] = None, chunk: int = 1 << 20) -> np.ndarray:
+    '''Same as `sparsity`, but from CSR arrays (symmetric storage is already expanded)'''
+    size = matrix.shape[0]
+    shape, delta = (size, 1.0) if shape is None else (shape, size/shape)
+    image = np.zeros((shape, shape), dtype=np.bool_)
+    for start in range(0, matrix.nnz, chunk):
+        positions = np.arange(start, min(start+chunk, matrix.nnz))
+        rows = np.searchsorted(matrix.indptr, positions, side='right') - 1
+        cols = np.asarray(matrix.indices[start:start+chunk], dtype=np.int64)
+        image[np.ceil((rows+1)/delta).astype(np.int64)-1, np.ceil((cols+1)/delta).astype(np.int64)-1] = True
+    return image
+
+
+def imsave(path: Path, image: np.ndarray) -> None:
+    '''Write a boolean image as a 1-bit grayscale PNG (True is white, as `cmap='gray'`)'''
+    height, width = image.shape
+    rows = np.packbits(image.astype(np.bool_), axis=1)
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), rows]).tobytes()  # filter type 0
+    chunk = lambda kind, data: \
+        struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind+data))
+    p.Path(path).write_bytes(b''.join([
+        b'\x89PNG\r\n\x1a\n',
+        chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 1, 0, 0, 0, 0)),
+        chunk(b'IDAT', zlib.compress(raw)),
+        chunk(b'IEND', b''),
+    ]))
+
+
+def render(src: Path, dst: Path, shape: t.Optional[int] = None, cache: t.Optional[Path] = None) -> float:
+    '''Render the sparsity PNG of `src` into `dst` and return the elapsed seconds'''
+    tic = time.perf_counter()
+    if cache is None:
+        image = sparsity(src, shape)
+    else:
+        image = sparsity_csr(CSRCache(cache).load(src), shape)
+    imsave(dst, image)
+    return time.perf_counter() - tic
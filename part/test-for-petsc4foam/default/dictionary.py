@@ -0,0 +1,361 @@
+import dataclasses as d
+import os
+import pathlib as p
+import re
+import typing as t
+
+import typing_extensions as te
+
+
+TOKEN = re.compile(r'''
+    (?P<space>\s+)
+  | (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<verbatim>\#\{.*?\#\})
+  | (?P<string>"(?:[^"\\]|\\.)*")
+  | (?P<punct>[{};()\[\]])
+  | (?P<word>(?:[^\s{};()\[\]"/]|/(?![/*]))+)
+  | (?P<other>.)
+''', re.S | re.X)
+INCLUDES = {'#include', '#includeIfPresent', '#sinclude', '#includeEtc'}
+OPEN, CLOSE = {'(': ')', '[': ']', '{': '}'}, {')', ']', '}'}
+
+
+class Token(t.NamedTuple):
+    kind: str
+    text: str
+    start: int
+    end: int
+
+
+@d.dataclass
+class Entry:
+    '''A keyword and its value, with the character span of the whole entry in `source`'''
+
+    key: str
+    start: int
+    end: int
+    value: str = ''  # raw text of a primitive entry, without the trailing semicolon
+    children: t.Optional['Node'] = None
+    source: t.Optional['FoamDictionary'] = None  # None when the entry comes from an #include
+
+
+@d.dataclass
+class Node:
+    '''Entries of one dictionary in order, `body` is the span between its braces'''
+
+    entries: t.Dict[str, Entry]
+    body: t.Tuple[int, int]
+
+
+def tokenize(text: str) -> t.List[Token]:
+    return [
+        Token(match.lastgroup, match.group(), match.start(), match.end())
+        for match in TOKEN.finditer(text)
+        if match.lastgroup not in {'space', 'comment'}
+    ]
+
+
+def unquote(key: str) -> str:
+    return key[1:-1] if len(key) > 1 and key[0] == key[-1] == '"' else key
+
+
+class FoamDictionary:
+    '''In-process reader/writer of OpenFOAM dictionaries, in place of `foamDictionary` calls
+
+    The file is parsed once; reads are lookups in the parsed tree and writes splice
+    the file text, so comments and formatting outside the edited entries survive.
+    `#include` and `#includeEtc` are expanded for reads (the latter only when
+    `$WM_PROJECT_DIR` is set), `$macros` are not. Edits are kept in memory until
+    `write` (or leaving the `with` block).
+    '''
+
+    def __init__(self, path: t.Union[str, p.Path]) -> None:
+        self._path = p.Path(path)
+        self._text = self._path.read_text(errors='surrogateescape')
+        self._dirty = False
+        self._root = self._parse()
+        self._stamp = self._stat()
+
+    def __enter__(self) -> te.Self:
+        return self
+
+    def __exit__(self, *args: t.Any) -> None:
+        self.write()
+
+    def __contains__(self, entry: str) -> bool:
+        return self._find(entry) is not None
+
+    @property
+    def path(self) -> p.Path:
+        return self._path
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    @property
+    def stale(self) -> bool:
+        '''Whether the file changed on disk since it was read or written'''
+        return self._stat() != self._stamp
+
+    def keywords(self, entry: str = '') -> t.List[str]:
+        '''Keywords of a sub-dictionary (`-keywords`), empty if missing or not a dictionary'''
+        node = self._node(entry)
+        return [] if node is None else list(node.entries)
+
+    def value(self, entry: str) -> t.Optional[str]:
+        '''Raw value of a primitive entry (`-value`), None if missing or a dictionary'''
+        found = self._find(entry)
+        return None if found is None or found.children is not None else found.value
+
+    def set(self, entry: str, value: str) -> te.Self:
+        '''`-set`: a value starting with `{` becomes a sub-dictionary, missing parents are created'''
+        *parents, key = entry.split('/')
+        for ith in range(1, len(parents)+1):
+            found = self._find('/'.join(parents[:ith]))
+            if found is not None and found.source is not self:
+                raise ValueError(f'{entry} is inside an #include of {self._path}')
+        if parents and self._node('/'.join(parents)) is None:
+            self.set('/'.join(parents), '{}')
+        node = self._node('/'.join(parents))
+        found = self._lookup(node, key)
+        if found is not None and found.source is self:
+            indent = self._indent(found.start)
+            self._splice(found.start, found.end, self._format(found.key, value, indent))
+        else:
+            self._insert(node, parents, (key, value))
+        return self
+
+    def remove(self, entry: str) -> te.Self:
+        '''`-remove`: drop the entry, and its line when nothing else is on it'''
+        found = self._find(entry)
+        if found is not None and found.source is self:
+            start, end = found.start, found.end
+            head = self._text.rfind('\n', 0, start) + 1
+            tail = self._text.find('\n', end)
+            tail = len(self._text) if tail < 0 else tail
+            if not self._text[head:start].strip() and not self._text[end:tail].strip():
+                start, end = head, min(tail+1, len(self._text))
+            self._splice(start, end, '')
+        return self
+
+    def write(self) -> None:
+        if self._dirty:
+            self._path.write_text(self._text, errors='surrogateescape')
+            self._dirty = False
+            self._stamp = self._stat()
+
+    def _stat(self) -> t.Tuple[int, int]:
+        stat = self._path.stat()
+        return stat.st_mtime_ns, stat.st_size
+
+    def _find(self, entry: str) -> t.Optional[Entry]:
+        node, found = self._root, None
+        for key in filter(None, entry.split('/')):
+            if node is None:
+                return None
+            found = self._lookup(node, key)
+            if found is None:
+                return None
+            node = found.children
+        return found
+
+    def _node(self, entry: str) -> t.Optional[Node]:
+        if not entry:
+            return self._root
+        found = self._find(entry)
+        return None if found is None else found.children
+
+    @staticmethod
+    def _lookup(node: t.Optional[Node], key: str) -> t.Optional[Entry]:
+        if node is None:
+            return None
+        if key in node.entries:
+            return node.entries[key]
+        for other, entry in node.entries.items():
+            if unquote(other) == unquote(key):
+                return entry
+        return None
+
+    def _splice(self, start: int, end: int, text: str) -> None:
+        self._text = self._text[:start] + text + self._text[end:]
+        self._dirty = True
+        self._root = self._parse()
+
+    def _indent(self, position: int) -> str:
+        line = self._text[self._text.rfind('\n', 0, position)+1:position]
+        return line[:len(line)-len(line.lstrip())]
+
+    def _insert(self, node: Node, parents: t.List[str], text: t.Tuple[str, str]) -> None:
+        '''Add an entry after the last local one of `node`, or as the only one of an empty body'''
+        for entry in reversed(node.entries.values()):
+            if entry.source is self:
+                indent = self._indent(entry.start)
+                return self._splice(entry.end, entry.end, f'\n{indent}{self._format(*text, indent)}')
+        if not parents:
+            return self._splice(len(self._text), len(self._text), f'\n{self._format(*text, "")}\n')
+        outer = self._indent(self._find('/'.join(parents)).start)
+        start, end = node.body
+        entry = self._format(*text, outer+' '*4)
+        if self._text[start:end].strip():
+            self._splice(start, start, f'\n{outer}    {entry}')
+        else:
+            self._splice(start, end, f'\n{outer}    {entry}\n{outer}')
+
+    def _format(self, key: str, value: str, indent: str) -> str:
+        value = value.strip()
+        if not value.startswith('{'):
+            return f'{key} {value};'
+        lines, _ = self._format_body(value, tokenize(value), 1, 1)
+        return '\n'.join([f'{key} {{', *(indent+line for line in lines), indent+'}'])
+
+    def _format_body(self, text: str, tokens: t.List[Token], ith: int, depth: int) -> t.Tuple[t.List[str], int]:
+        '''Dictionary body after its `{` with one entry per line, and the index after its `}`'''
+        pad, lines = ' '*4*depth, []
+        while ith < len(tokens) and tokens[ith].text != '}':
+            if tokens[ith].text == ';':
+                ith += 1
+                continue
+            key, ith = tokens[ith].text, ith + 1
+            if ith < len(tokens) and tokens[ith].text == '{':
+                inner, ith = self._format_body(text, tokens, ith+1, depth+1)
+                lines.extend([f'{pad}{key} {{', *inner, f'{pad}}}'])
+                continue
+            close = self._skip_value(tokens, ith)
+            value = text[tokens[ith].start:tokens[close-1].end] if close > ith else ''
+            lines.append(f'{pad}{key} {value};' if value else f'{pad}{key};')
+            ith = close + 1 if close < len(tokens) and tokens[close].text == ';' else close
+        return lines, ith + 1
+
+    @staticmethod
+    def _skip_value(tokens: t.List[Token], ith: int) -> int:
+        '''Index of the semicolon (or closing brace) ending the value that starts at `ith`'''
+        depth = 0
+        while ith < len(tokens):
+            text = tokens[ith].text
+            if tokens[ith].kind == 'punct':
+                if text in OPEN:
+                    depth += 1
+                elif text in CLOSE:
+                    if depth == 0:
+                        return ith
+                    depth -= 1
+                elif text == ';' and depth == 0:
+                    return ith
+            ith += 1
+        return ith
+
+    def _parse(self) -> Node:
+        tokens = tokenize(self._text)
+        root, _ = self._parse_body(self._text, tokens, 0, self, self._path.parent, (0, len(self._text)))
+        return root
+
+    def _parse_body(
+        self, text: str, tokens: t.List[Token], ith: int, source: t.Optional[te.Self],
+        directory: p.Path, body: t.Tuple[int, int],
+    ) -> t.Tuple[Node, int]:
+        node = Node({}, body)
+        while ith < len(tokens) and tokens[ith].text != '}':
+            token = tokens[ith]
+            if token.text == ';':
+                ith += 1
+                continue
+            if token.kind == 'word' and token.text.startswith('#'):
+                ith = self._directive(text, tokens, ith, node, directory)
+                continue
+            # keyword, possibly with a parenthesised part such as div(phi,U)
+            end, ith = token.end, ith + 1
+            if token.kind == 'word' and ith < len(tokens) and tokens[ith].text == '(' and tokens[ith].start == end:
+                close = self._skip_value(tokens, ith+1)
+                end, ith = tokens[close].end, close + 1
+            key = text[token.start:end]
+            if ith < len(tokens) and tokens[ith].text == '{':
+                children, close = self._parse_body(
+                    text, tokens, ith+1, source, directory, (tokens[ith].end, tokens[ith].end),
+                )
+                if close < len(tokens):
+                    children.body = tokens[ith].end, tokens[close].start
+                    stop, ith = tokens[close].end, close + 1
+                else:
+                    stop, ith = len(text), close
+                node.entries.pop(key, None)
+                node.entries[key] = Entry(key, token.start, stop, children=children, source=source)
+                continue
+            close = self._skip_value(tokens, ith)
+            value = text[tokens[ith].start:tokens[close-1].end] if close > ith else ''
+            stop = tokens[close].end if close < len(tokens) and tokens[close].text == ';' else \
+                (tokens[close-1].end if close > ith else end)
+            node.entries.pop(key, None)
+            node.entries[key] = Entry(key, token.start, stop, value=value, source=source)
+            ith = close + 1 if close < len(tokens) and tokens[close].text == ';' else close
+        return node, ith
+
+    def _directive(self, text: str, tokens: t.List[Token], ith: int, node: Node, directory: p.Path) -> int:
+        '''Skip a `#directive` and its arguments on the same line, expanding includes into `node`'''
+        name, line = tokens[ith].text, text.count('\n', 0, tokens[ith].start)
+        ith += 1
+        arguments = []
+        while ith < len(tokens) and text.count('\n', 0, tokens[ith].start) == line and tokens[ith].text not in {'}', ';'}:
+            if tokens[ith].text in OPEN:
+                close = self._skip_value(tokens, ith+1)
+                arguments.append(text[tokens[ith].start:tokens[close].end])
+                ith = close + 1
+            else:
+                arguments.append(tokens[ith].text)
+                ith += 1
+        if name in INCLUDES and arguments:
+            path = self._resolve(name, unquote(arguments[0]), directory)
+            if path is not None:
+                included = path.read_text(errors='surrogateescape')
+                child, _ = self._parse_body(included, tokenize(included), 0, None, path.parent, (0, 0))
+                for key, entry in child.entries.items():
+                    node.entries.pop(key, None)
+                    node.entries[key] = entry
+        return ith
+
+    def _resolve(self, name: str, argument: str, directory: p.Path) -> t.Optional[p.Path]:
+        environ = {'FOAM_CASE': self._case().as_posix(), **os.environ}
+        argument = re.sub(r'\$\{?(\w+)\}?', lambda m: environ.get(m.group(1), m.group()), argument)
+        if name == '#includeEtc':
+            etc = os.environ.get('WM_PROJECT_DIR')
+            candidates = [p.Path(etc)/'etc'/argument] if etc else []
+        else:
+            candidates = [directory/argument]
+        return next(filter(p.Path.is_file, candidates), None)
+
+    def _case(self) -> p.Path:
+        for parent in self._path.parents:
+            if (parent/'system').is_dir():
+                return parent
+        return self._path.parent
+
+
+if __name__ == '__main__':
+    import shutil
+    import tempfile
+
+    case = p.Path(__file__).parents[1] / 'tuning' / 'mixerVessel2D' / 'original'
+    with tempfile.TemporaryDirectory() as directory:
+        shutil.copytree(case, p.Path(directory)/'case')
+        system = p.Path(directory) / 'case' / 'system'
+        control = FoamDictionary(system/'controlDict')
+        assert control.value('application') == 'multiphaseInterFoam'
+        assert 'libs' not in control and 'functions/sTransport/libs' in control
+        solution = FoamDictionary(system/'fvSolution')
+        assert solution.keywords('solvers') == ['"alpha.*"', '"pcorr.*"', 'p_rgh', 'p_rghFinal', '"(U|T).*"']
+        with solution:
+            for key in solution.keywords('solvers'):
+                solution.set(f'solvers/{key}/solver', 'petsc')
+                solution.set(f'solvers/{key}/petsc', '{ options { ksp_type cg; pc_type jacobi; } }')
+                solution.remove(f'solvers/{key}/preconditioner')
+        solution = FoamDictionary(system/'fvSolution')
+        for key in solution.keywords('solvers'):
+            assert solution.value(f'solvers/{key}/solver') == 'petsc'
+            assert solution.value(f'solvers/{key}/petsc/options/ksp_type') == 'cg'
+            assert f'solvers/{key}/preconditioner' not in solution
+        assert solution.value('solvers/p_rgh/relTol') == '0.05'
+        assert solution.text.startswith('/*---') and solution.value('PIMPLE/nCorrectors') == '4'
+        for path in (p.Path(directory)/'case'/'0.orig').iterdir():
+            field = FoamDictionary(path)
+            assert field.keywords('boundaryField') == ['rotor', 'stator', 'front', 'back']
+        print(solution.text[solution.text.index('solvers'):solution.text.index('PIMPLE')])
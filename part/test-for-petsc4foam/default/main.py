@@ -1,21 +1,66 @@
+import asyncio
+import contextlib as cl
 import functools as f
+import hashlib
+import itertools as it
+import json
+import math as m
 import os
 import pathlib as p
 import shutil
+import statistics
 import subprocess as sp
+import threading
 import time
 import typing as t
 
 import typing_extensions as te
 
+from dictionary import FoamDictionary
+from runner import Abort, Outcome, watch
+from solverlog import BREAKDOWN, Profile, Sink, Steps, Trace
+from staging import clone
+
 
 P = te.ParamSpec('P')
 Kwargs = te.ParamSpecKwargs(P)
+Cpus = t.Set[int]
+Stamp = t.Optional[t.List[t.Any]]  # [st_mtime_ns, st_size, sha256], None for a missing file
+
+
+class Sample(t.NamedTuple):
+    '''One run: wall seconds, CPU seconds and max RSS (KiB) of the whole process tree, solver log times'''
+
+    wall: float
+    cpu: float
+    maxrss: int
+    execution: float  # last cumulative ExecutionTime in the log, nan without one
+    steps: t.List[float]  # ExecutionTime increments, one per time step
+
+
+def summarize(values: t.Sequence[float], confidence: float = 0.95) -> t.Dict[str, float]:
+    '''Median, interquartile range and a distribution-free confidence interval of the median
+
+    The interval is `[x_(k), x_(n+1-k)]` with the largest `k` whose binomial coverage
+    still reaches `confidence`; with too few samples it is the full range.
+    '''
+    xs = sorted(values)
+    n = len(xs)
+    if n == 0:
+        return {'median': m.nan, 'iqr': m.nan, 'ci_low': m.nan, 'ci_high': m.nan}
+    q1, _, q3 = statistics.quantiles(xs, n=4) if n > 1 else (xs[0], xs[0], xs[0])
+    k = 1
+    for kk in range(1, (n+1)//2+1):
+        coverage = 1.0 - 2.0 * sum(m.comb(n, ith) for ith in range(kk)) / 2**n
+        if coverage >= confidence:
+            k = kk
+    return {'median': statistics.median(xs), 'iqr': q3 - q1, 'ci_low': xs[k-1], 'ci_high': xs[n-k]}
 
 
 class Tutorial:
 
     root = p.Path(os.environ['FOAM_TUTORIALS'])
+    index = p.Path(__file__).parent / 'cache' / 'index.json'
 
     def __init__(self, directory: str) -> None:
         self._directory = p.Path(directory)
@@ -27,13 +72,26 @@ class Tutorial:
         self._psd = self._directory / 'system' / 'decomposeParDict'
         self._psfa = self._directory / 'system' / 'faSolution'
         self._psfv = self._directory / 'system' / 'fvSolution'
+        self._dicts: t.Dict[p.Path, FoamDictionary] = {}
+        self._cpus: t.Optional[Cpus] = None
+        self.abort: t.Optional[Abort] = None  # of the last run_or_parallel_measure
+        self.profile: t.Optional[Profile] = None  # of its last run
 
     @classmethod
-    def iterValids(cls) -> t.Iterator[te.Self]:
-        for path in cls.root.rglob('controlDict'):
-            self = cls(path.parents[1])
-            if self.is_valid():
-                yield self
+    def iterValids(cls, index: t.Optional[p.Path] = None) -> t.Iterator[te.Self]:
+        '''Valid tutorials under `root`, validated again only when their files changed'''
+        with Index(cls.index if index is None else index) as idx:
+            for relative in idx.scan(cls.root):
+                self = cls(cls.root/relative)
+                fingerprint = self.fingerprint(idx.files(relative))
+                entry = idx.get(relative, fingerprint)
+                if entry is None:
+                    entry = idx.put(relative, fingerprint, self._summary())
+                if entry['valid']:
+                    for key in ['application', 'number_of_subdomains']:
+                        if entry[key] is not None:
+                            self.__dict__[key] = entry[key]  # seeds the cached properties
+                    yield self
 
     @property
     def directory(self) -> p.Path:
@@ -41,12 +99,12 @@ class Tutorial:
 
     @f.cached_property
     def application(self) -> str:
-        return self._fd(f'{self._psc} -entry application -value')
+        return self._fd(self._psc).value('application') or ''
 
     @f.cached_property
     def number_of_subdomains(self) -> int:
         if self._psd.exists():
-            return int(self._fd(f'{self._psd} -entry numberOfSubdomains -value'))
+            return int(self._fd(self._psd).value('numberOfSubdomains'))
         else:
             return 1
 
@@ -54,6 +112,16 @@ class Tutorial:
     def is_parallel(self) -> bool:
         return self._parp.exists() and self.number_of_subdomains > 1
 
+    @property
+    def cores(self) -> int:
+        '''Number of CPUs a run of this tutorial keeps busy'''
+        return self.number_of_subdomains if self.is_parallel else 1
+
+    def pin(self, cpus: t.Optional[Cpus]) -> te.Self:
+        '''Run every later command of this tutorial on `cpus` only (None lifts the restriction)'''
+        self._cpus = cpus
+        return self
+
     def is_valid(self) -> bool:
         for func in [
             self._valid_exists, self._valid_allrun,
@@ -66,31 +134,62 @@ class Tutorial:
                 return False
         return True
 
+    def fingerprint(self, previous: t.Optional[t.Dict[str, Stamp]] = None) -> t.Dict[str, Stamp]:
+        '''Content hashes of every file the validators and cached properties read
+
+        Files whose size and mtime match `previous` are not read again.
+        '''
+        paths = [self._par, self._parp, self._pac, self._psc, self._psd, self._psfa, self._psfv]
+        if self._p0.is_dir():
+            paths.extend(sorted(self._p0.iterdir()))
+        ans: t.Dict[str, Stamp] = {}
+        for path in paths:
+            name = path.relative_to(self._directory).as_posix()
+            try:
+                stat = path.stat()
+            except OSError:
+                ans[name] = None
+                continue
+            stamp = (previous or {}).get(name)
+            if stamp is None or stamp[:2] != [stat.st_mtime_ns, stat.st_size]:
+                digest = hashlib.sha256(path.read_bytes()).hexdigest() if path.is_file() else ''
+                stamp = [stat.st_mtime_ns, stat.st_size, digest]
+            ans[name] = stamp
+        return ans
+
     def copy(self, dst: str) -> te.Self:
         directory = dst / self._directory.relative_to(self.root)
-        shutil.copytree(self._directory, directory, dirs_exist_ok=True)
+        shutil.copytree(self._directory, directory, dirs_exist_ok=True, copy_function=clone)
         return self.__class__(directory)
 
     def hook_foam(self) -> te.Self:
-        self._fd(f'{self._psc} -entry startFrom -set startTime')
+        with self._fd(self._psc) as fd:
+            fd.set('startFrom', 'startTime')
         return self
 
-    def hook_petsc(self, options: t.Dict[str, str] = {}) -> te.Self:
+    def hook_petsc(
+        self, options: t.Dict[str, str] = {},
+        select: t.Optional[t.Callable[[str], t.Optional[t.Dict[str, str]]]] = None,
+    ) -> te.Self:
+        '''Switch every `solvers/<key>` to PETSc, with `select(key)` overriding `options` when given'''
         # faSolution, fvSolution
-        petsc = ' '.join(f'{key} {val};' for key, val in options.items())
         for path in filter(p.Path.exists, [self._psfv, self._psfa]):
-            for key in self._fd(f'{path} -entry solvers -keywords').splitlines():
-                self._fd(f'{path} -entry solvers/{key}/solver -set petsc')
-                self._fd(f'{path} -entry solvers/{key}/petsc -set "{{ options {{ {petsc} }} }}"')
-                self._fd(f'{path} -entry solvers/{key}/preconditioner -remove')
+            with self._fd(path) as fd:
+                for key in fd.keywords('solvers'):
+                    selected = (select and select(key)) or options
+                    petsc = ' '.join(f'{k} {v};' for k, v in selected.items())
+                    fd.set(f'solvers/{key}/solver', 'petsc')
+                    fd.set(f'solvers/{key}/petsc', f'{{ options {{ {petsc} }} }}')
+                    fd.remove(f'solvers/{key}/preconditioner')
         # controlDict
-        self._fd(f'{self._psc} -entry libs -set "(petscFoam)"')
+        with self._fd(self._psc) as fd:
+            fd.set('libs', '(petscFoam)')
         return self
 
     def all_run_or_parallel(self, auto: bool = True, timeout: float = 300.0, delete: bool = False) -> bool:
         script = self._parp if auto and self.is_parallel else self._par
         try:
-            flag = self._raw(script.as_posix(), timeout=timeout).returncode == 0
+            flag = self._wait4(script.as_posix(), None, timeout).returncode == 0
         except Exception:
             flag = False
         if delete and not flag:
@@ -114,7 +213,7 @@ class Tutorial:
         log = self._directory / f'log.{self.application}'
         log.exists() and log.unlink()
         try:
-            flag = self._raw(cmd, timeout=timeout).returncode == 0
+            flag = self._wait4(cmd, log, timeout).returncode == 0
         except Exception:
             flag = False
         if delete and not flag:
@@ -122,20 +221,102 @@ class Tutorial:
         return flag
 
     def run_or_parallel_timer(self, auto: bool = True, timeout: float = 900.0, delete: bool = False) -> t.Optional[float]:
-        tic = time.time()
+        tic = time.perf_counter()
         flag = self.run_or_parallel(auto, timeout, delete)
-        toc = time.time()
+        toc = time.perf_counter()
         return toc - tic if flag else None
 
+    def run_or_parallel_measure(
+        self, auto: bool = True, timeout: float = 900.0, delete: bool = False,
+        warmup: int = 1, number: int = 5, limit: t.Optional[float] = None, ceiling: t.Optional[float] = None,
+        trace: t.Optional[p.Path] = None,
+    ) -> t.Optional[t.List[Sample]]:
+        '''`number` timed runs after `warmup` untimed ones, None as soon as one fails
+
+        Every run is waited for with `wait4`, so CPU time and max RSS cover the shell,
+        the solver and its MPI ranks but no other child of this process. A run is
+        aborted after `limit` seconds or once its residuals diverge (`runner.Guard`),
+        the reason being kept in `abort`. Each log is parsed once, while it is written:
+        the solves of the last run go to `profile` and, column-wise, to `trace`.
+        '''
+        source = '. $WM_PROJECT_DIR/bin/tools/RunFunctions'
+        func = 'runParallel' if auto and self.is_parallel else 'runApplication'
+        cmd = f'{source} && {func} {self.application}'
+        log = self._directory / f'log.{self.application}'
+        samples = []
+        for ith in range(warmup+number):
+            log.exists() and log.unlink()
+            self.abort, self.profile, steps = None, Profile(), Steps()
+            try:
+                with cl.ExitStack() as stack:
+                    sinks: t.List[Sink] = [steps, self.profile]
+                    if trace is not None and ith == warmup+number-1:
+                        sinks.append(stack.enter_context(Trace(trace)))
+                    returncode, wall, usage, self.abort = self._wait4(cmd, log, timeout, limit, ceiling, sinks)
+            except Exception:
+                returncode = -1
+            if returncode != 0 or self.abort is not None:
+                if delete:
+                    self.all_delete()
+                return None
+            if ith < warmup:
+                continue
+            samples.append(Sample(
+                wall=wall, cpu=usage.ru_utime+usage.ru_stime, maxrss=usage.ru_maxrss,
+                execution=steps.execution, steps=steps.increments,
+            ))
+        return samples
+
     def _raw(self, cmd: str, **kwargs: Kwargs) -> sp.CompletedProcess:
         kwargs = {'shell': True, 'cwd': self._directory, 'capture_output': True, **kwargs}
-        return sp.run(cmd, **kwargs)
+        with self._pinned(kwargs):
+            return sp.run(cmd, **kwargs)
+
+    def _wait4(
+        self, cmd: str, log: t.Optional[p.Path], timeout: float,
+        limit: t.Optional[float] = None, ceiling: t.Optional[float] = None, sinks: t.Sequence[Sink] = (),
+    ) -> Outcome:
+        '''`runner.watch` of `cmd`, with the whole process group killed on timeout and `log` fed to `sinks`'''
+        kwargs = {'cwd': self._directory}
+        # the event loop forks in this thread, so it is pinned for the whole run
+        with self._pinned(kwargs):
+            return asyncio.run(watch(cmd, log, timeout, limit, sinks, ceiling, **kwargs))
+
+    @cl.contextmanager
+    def _pinned(self, kwargs: t.Dict[str, t.Any]) -> t.Iterator[None]:
+        '''Confine children started inside the block to `self._cpus`, adjusting `kwargs[\'env\']`'''
+        if self._cpus is None:
+            yield
+            return
+        # MPI ranks float inside the CPU set instead of being bound to cores outside of it
+        kwargs['env'] = {
+            **os.environ, 'OMP_NUM_THREADS': '1', 'OMPI_MCA_hwloc_base_binding_policy': 'none',
+            **kwargs.get('env', {}),
+        }
+        # on Linux the affinity of the calling thread is what the forked child inherits
+        previous = os.sched_getaffinity(0)
+        os.sched_setaffinity(0, self._cpus)
+        try:
+            yield
+        finally:
+            os.sched_setaffinity(0, previous)
 
     def _run(self, cmd: str, **kwargs: Kwargs) -> str:
         return self._raw(cmd, **kwargs).stdout.decode().strip()
 
-    def _fd(self, cmd: str) -> str:
-        return self._run(f'foamDictionary {cmd}')
+    def _fd(self, path: p.Path) -> FoamDictionary:
+        '''Parsed dictionary of `path`, kept until the file changes on disk'''
+        if path not in self._dicts or self._dicts[path].stale:
+            self._dicts[path] = FoamDictionary(path)
+        return self._dicts[path]
+
+    def _summary(self) -> t.Dict[str, t.Any]:
+        ans = {'valid': self.is_valid(), 'application': None, 'number_of_subdomains': None}
+        if ans['valid']:
+            for key in ['application', 'number_of_subdomains']:
+                with cl.suppress(Exception):
+                    ans[key] = getattr(self, key)
+        return ans
 
     def _valid_exists(self) -> bool:
         paths = [self._par, self._pac, self._p0, self._psc, self._psfv]
@@ -148,67 +329,361 @@ class Tutorial:
         return True
 
     def _valid_control_dict(self) -> bool:
-        return not self._fd(f'{self._psc} -entry libs')
+        return 'libs' not in self._fd(self._psc)
 
     def _valid_cyclic_ami(self) -> bool:
-        for path in self._p0.iterdir():
-            for key in self._fd(f'{path} -entry boundaryField -keywords').splitlines():
-                if self._fd(f'{path} -entry boundaryField/{key}/type -value') == 'cyclicAMI':
+        for path in filter(p.Path.is_file, self._p0.iterdir()):
+            fd = FoamDictionary(path)
+            for key in fd.keywords('boundaryField'):
+                if fd.value(f'boundaryField/{key}/type') == 'cyclicAMI':
                     return False
         return True
 
 
+class Index:
+    '''Persistent discovery and validation results of a tutorial tree
+
+    Discovery keeps the mtime of every directory under the root and walks again
+    only the subtrees whose directory mtimes changed (entries added, removed or
+    renamed). Validity, application and number of subdomains of every case are
+    kept with the fingerprint of the files they were derived from.
+    '''
+
+    version = 1
+
+    def __init__(self, path: p.Path) -> None:
+        self._path = p.Path(path)
+        data = json.loads(self._path.read_text()) if self._path.exists() else {}
+        if data.get('version') != self.version:
+            data = {'version': self.version, 'root': None, 'dirs': {}, 'controls': [], 'cases': {}}
+        self._data = data
+        self._dirty = False
+
+    def __enter__(self) -> te.Self:
+        return self
+
+    def __exit__(self, *args: t.Any) -> None:
+        self.save()
+
+    def scan(self, root: p.Path) -> t.List[str]:
+        '''Case directories (relative to `root`) that contain a `controlDict`, like `rglob`'''
+        root = p.Path(root)
+        if self._data['root'] != root.as_posix():
+            self._data.update(root=root.as_posix(), dirs={}, controls=[], cases={})
+        dirs: t.Dict[str, int] = self._data['dirs']
+        controls = set(self._data['controls'])
+        stale = sorted(relative for relative, mtime in dirs.items() if self._mtime(root, relative) != mtime)
+        if not dirs:
+            stale = ['.']
+        walked: t.List[str] = []
+        for relative in stale:
+            if any(self._within(relative, other) for other in walked):
+                continue
+            walked.append(relative)
+            for other in [other for other in dirs if self._within(other, relative)]:
+                del dirs[other]
+            controls = {other for other in controls if not self._within(other, relative)}
+            for directory, _, files in os.walk(root/relative):
+                other = p.Path(directory).relative_to(root).as_posix()
+                dirs[other] = self._mtime(root, other)
+                if 'controlDict' in files:
+                    controls.add(other)
+        cases = sorted({p.Path(control).parent.as_posix() for control in controls})
+        if walked:
+            self._data['controls'] = sorted(controls)
+            self._data['cases'] = {
+                case: self._data['cases'][case] for case in cases if case in self._data['cases']
+            }
+            self._dirty = True
+        return cases
+
+    def files(self, relative: str) -> t.Optional[t.Dict[str, Stamp]]:
+        entry = self._data['cases'].get(relative)
+        return None if entry is None else entry['files']
+
+    def get(self, relative: str, fingerprint: t.Dict[str, Stamp]) -> t.Optional[t.Dict[str, t.Any]]:
+        entry = self._data['cases'].get(relative)
+        if entry is None or self._digests(entry['files']) != self._digests(fingerprint):
+            return None
+        if entry['files'] != fingerprint:  # touched, same content
+            entry['files'] = fingerprint
+            self._dirty = True
+        return entry
+
+    def put(self, relative: str, fingerprint: t.Dict[str, Stamp], summary: t.Dict[str, t.Any]) -> t.Dict[str, t.Any]:
+        self._data['cases'][relative] = entry = {'files': fingerprint, **summary}
+        self._dirty = True
+        return entry
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self._path.with_name(f'.{self._path.name}.{os.getpid()}')
+        tmp.write_text(json.dumps(self._data))
+        os.replace(tmp, self._path)
+        self._dirty = False
+
+    @staticmethod
+    def _digests(fingerprint: t.Dict[str, Stamp]) -> t.Dict[str, t.Optional[str]]:
+        return {name: None if stamp is None else stamp[2] for name, stamp in fingerprint.items()}
+
+    @staticmethod
+    def _mtime(root: p.Path, relative: str) -> t.Optional[int]:
+        try:
+            return (root/relative).stat().st_mtime_ns
+        except OSError:
+            return None
+
+    @staticmethod
+    def _within(relative: str, ancestor: str) -> bool:
+        return ancestor == '.' or relative == ancestor or relative.startswith(ancestor+'/')
+
+
+class Loan:
+    '''CPUs reserved by `Cores.reserve`, with the contention seen while they were held'''
+
+    def __init__(self, cpus: Cpus, count: int) -> None:
+        self.cpus = cpus
+        self.count = count
+        self.concurrent = 1
+        self.load = 0.0
+
+
+class Cores:
+    '''CPUs lent to concurrently running tutorials without oversubscription
+
+    Requests are served first come, first served, so a parallel case waiting
+    for many CPUs is not starved by serial ones. For every loan, the largest
+    number of cases that ran at the same time is recorded as contention.
+    '''
+
+    def __init__(self, cores: t.Optional[int] = None) -> None:
+        available = sorted(os.sched_getaffinity(0))
+        self._free = set(available[:cores] if cores else available)
+        self._total = len(self._free)
+        self._condition = threading.Condition()
+        self._tickets = it.count()
+        self._serving = 0
+        self._peaks: t.Dict[int, int] = {}
+
+    @property
+    def total(self) -> int:
+        return self._total
+
+    @cl.contextmanager
+    def reserve(self, count: int) -> t.Iterator['Loan']:
+        count = max(1, min(count, self._total))
+        with self._condition:
+            ticket = next(self._tickets)
+            self._condition.wait_for(lambda: self._serving == ticket and len(self._free) >= count)
+            cpus = set(sorted(self._free)[:count])
+            self._free -= cpus
+            self._serving += 1
+            self._peaks[ticket] = 0
+            for key in self._peaks:
+                self._peaks[key] = max(self._peaks[key], len(self._peaks))
+            self._condition.notify_all()
+        loan = Loan(cpus, count)
+        try:
+            yield loan
+        finally:
+            with self._condition:
+                self._free |= cpus
+                loan.concurrent = self._peaks.pop(ticket)
+                loan.load = os.getloadavg()[0] / self._total
+                self._condition.notify_all()
+
+
 class TSV:
+    '''Append-only TSV table with an in-memory index, loaded once and kept in sync on append
 
-    def __init__(self, path: str, columns: t.List[str]) -> None:
+    Rows are buffered and written with a single `os.write` on an `O_APPEND` descriptor,
+    followed by one `fsync` per `batch` rows; a torn last line is dropped on load.
+    '''
+
+    def __init__(self, path: str, columns: t.List[str], keys: int = 1, batch: int = 64) -> None:
         self._path = p.Path(path)
-        if not self._path.exists():
+        self._keys = keys
+        self._batch = batch
+        self._buffer: t.List[str] = []
+        self._cells: t.Set[str] = set()
+        self._rows: t.Dict[t.Tuple[str, ...], t.List[str]] = {}
+        if self._path.exists():
+            self._load()
+        else:
             self._path.parent.mkdir(parents=True, exist_ok=True)
             self._append(columns)
+            self.flush()
 
     def __contains__(self, key: str) -> bool:
-        with open(self._path, 'r') as f:
-            for line in f:
-                if key in line.strip().split('\t'):
-                    return True
-        return False
+        return key in self._cells
+
+    def __enter__(self) -> te.Self:
+        return self
+
+    def __exit__(self, *args: t.Any) -> None:
+        self.flush()
+
+    def get(self, *keys: str) -> t.Optional[t.List[str]]:
+        '''Remaining cells of the last row whose leading cells are `keys`'''
+        return self._rows.get(keys)
 
     def append(self, *parts: str) -> None:
         self._append(parts)
+        if len(self._buffer) >= self._batch:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+        fd = os.open(self._path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+        try:
+            os.write(fd, ''.join(self._buffer).encode())
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self._buffer.clear()
 
     def _append(self, parts: t.Iterable[str]) -> None:
-        with open(self._path, 'a+') as f:
-            f.write('\t'.join(map(str, parts)) + '\n')
+        cells = list(map(str, parts))
+        self._buffer.append('\t'.join(cells) + '\n')
+        self._index(cells)
+
+    def _index(self, cells: t.List[str]) -> None:
+        self._cells.update(cells)
+        if len(cells) > self._keys:
+            self._rows[tuple(cells[:self._keys])] = cells[self._keys:]
+
+    def _load(self) -> None:
+        with open(self._path, 'r+') as f:
+            text = f.read()
+            if text and not text.endswith('\n'):  # torn write
+                text = text[:text.rfind('\n')+1]
+                f.truncate(len(text.encode()))
+        for line in text.splitlines():
+            self._index(line.strip().split('\t'))
+
+
+STATS = [
+    'tutorial', 'variant', 'number',
+    *(f'{key}_{stat}' for key in ['wall', 'execution'] for stat in ['median', 'iqr', 'ci_low', 'ci_high']),
+    'step_median', 'cpu_median', 'maxrss_max',
+]
+
+
+def stats(samples: t.List[Sample]) -> t.List[t.Any]:
+    '''Cells of `STATS` after the tutorial and the variant'''
+    wall = summarize([sample.wall for sample in samples])
+    execution = summarize([sample.execution for sample in samples if m.isfinite(sample.execution)])
+    steps = [step for sample in samples for step in sample.steps]
+    return [
+        len(samples),
+        *(wall[stat] for stat in ['median', 'iqr', 'ci_low', 'ci_high']),
+        *(execution[stat] for stat in ['median', 'iqr', 'ci_low', 'ci_high']),
+        statistics.median(steps) if steps else m.nan,
+        statistics.median(sample.cpu for sample in samples),
+        max(sample.maxrss for sample in samples),
+    ]
+
+
+def benchmark(
+    old: Tutorial, cores: Cores, cache: p.Path, timeout_foam: float, timeout_petsc: float,
+    petsc_options: t.Dict[str, str], warmup: int = 0, number: int = 1,
+    slowdown: t.Optional[float] = None, ceiling: t.Optional[float] = None,
+) -> t.Tuple[t.List[t.Any], t.List[t.Any], t.List[t.List[t.Any]], t.List[t.List[t.Any]], t.List[t.List[t.Any]]]:
+    '''Rows of `petsc4foam.tsv`, `contention.tsv`, `petsc4foam-stats.tsv`, `petsc4foam-solvers.tsv`
+    and `petsc4foam-aborts.tsv` for one tutorial
+
+    The times of `petsc4foam.tsv` are medians of the wall times, the timeouts are per run.
+    A petsc run is aborted once it is `slowdown` times slower than the foam time or once
+    its residuals exceed `ceiling`; its time is then minus the seconds it ran.
+    The solver breakdown is the one of the last run of each variant, whose columnar trace
+    is kept in `trace.<variant>` of the copied case.
+    '''
+    # init
+    new = old.copy(cache).hook_foam()
+    keys = new.directory.relative_to(cache).as_posix(), new.application, new.number_of_subdomains
+    rows, solvers, aborts = [], [], []
+    with cores.reserve(new.cores) as loan:
+        new.pin(loan.cpus)
+        row = [*keys, 'nan', 'nan']
+        if new.all_run_or_parallel(timeout=timeout_foam, delete=True):
+            # foam
+            samples = new.run_or_parallel_measure(
+                timeout=timeout_foam, delete=True, warmup=warmup, number=number, trace=new.directory/'trace.foam',
+            )
+            row = [*keys, -timeout_foam, 'nan']
+            if samples is not None:
+                rows.append([keys[0], 'foam', *stats(samples)])
+                solvers.extend([keys[0], 'foam', *cells] for cells in new.profile.breakdown())
+                time_foam = rows[-1][3]
+                # petsc
+                samples = new \
+                    .hook_petsc(options=petsc_options) \
+                    .run_or_parallel_measure(
+                        timeout=timeout_petsc, delete=True, warmup=warmup, number=number,
+                        limit=None if slowdown is None else slowdown*time_foam, ceiling=ceiling,
+                        trace=new.directory/'trace.petsc',
+                    )
+                time_petsc = -timeout_petsc
+                if samples is not None:
+                    rows.append([keys[0], 'petsc', *stats(samples)])
+                    solvers.extend([keys[0], 'petsc', *cells] for cells in new.profile.breakdown())
+                    time_petsc = rows[-1][3]
+                elif new.abort is not None:
+                    aborts.append([keys[0], 'petsc', *new.abort])
+                    time_petsc = -new.abort.seconds
+                row = [*keys, time_foam, time_petsc]
+    cpus = ','.join(map(str, sorted(loan.cpus)))
+    return row, [keys[0], cpus, loan.concurrent, f'{loan.load:.3f}'], rows, solvers, aborts
 
 
 if __name__ == '__main__':
+    import concurrent.futures as cf
+
+    import click
     import tqdm
 
-    timeout_foam, timeout_petsc = 300.0, 1800.0
-    cache = p.Path(__file__).parent / 'cache'
-    tsv = TSV('petsc4foam.tsv', ['tutorial', 'application', 'parallel', 'time_foam', 'time_petsc'])
-    petsc_options = {'ksp_type': 'cg', 'pc_type': 'jacobi'}
-
-    for old in tqdm.tqdm(Tutorial.iterValids(), total=150):
-        # init
-        new = old.copy(cache).hook_foam()
-        keys = new.directory.relative_to(cache).as_posix(), new.application, new.number_of_subdomains
-        if keys[0] in tsv:
-            continue
-        if not new.all_run_or_parallel(timeout=timeout_foam, delete=True):
-            tsv.append(*keys, 'nan', 'nan')
-            continue
-        # foam
-        time_foam = new.run_or_parallel_timer(timeout=timeout_foam, delete=True)
-        if time_foam is None:
-            tsv.append(*keys, -timeout_foam, 'nan')
-            continue
-        # petsc
-        time_petsc = new \
-            .hook_petsc(options=petsc_options) \
-            .run_or_parallel_timer(timeout=timeout_petsc, delete=True)
-        if time_petsc is None:
-            tsv.append(*keys, time_foam, -timeout_petsc)
-            continue
-        # tsv
-        tsv.append(*keys, time_foam, time_petsc)
+    @click.command()
+    @click.option('--jobs', type=int, default=1, help='Number of tutorials running at the same time')
+    @click.option('--cores', type=int, default=None, help='Number of CPUs to use (default: all)')
+    @click.option('--warmup', type=int, default=0, help='Untimed runs before the timed ones')
+    @click.option('--number', type=int, default=1, help='Timed runs per variant')
+    @click.option('--slowdown', type=float, default=6.0, help='Abort a petsc run this many times slower than foam (0: never)')
+    @click.option('--ceiling', type=float, default=1e3, help='Abort a petsc run once an initial residual exceeds it (0: never)')
+    def main(jobs: int, cores: t.Optional[int], warmup: int, number: int, slowdown: float, ceiling: float) -> None:
+        timeout_foam, timeout_petsc = 300.0, 1800.0
+        cache = p.Path(__file__).parent / 'cache'
+        tsv = TSV('petsc4foam.tsv', ['tutorial', 'application', 'parallel', 'time_foam', 'time_petsc'], batch=1)
+        contention = TSV('contention.tsv', ['tutorial', 'cpus', 'concurrent', 'load'], batch=1)
+        summary = TSV('petsc4foam-stats.tsv', STATS, keys=2, batch=1)
+        breakdown = TSV('petsc4foam-solvers.tsv', ['tutorial', 'variant', *BREAKDOWN], keys=4, batch=1)
+        aborts = TSV('petsc4foam-aborts.tsv', ['tutorial', 'variant', *Abort._fields], keys=2, batch=1)
+        petsc_options = {'ksp_type': 'cg', 'pc_type': 'jacobi'}
+
+        budget = Cores(cores)
+        olds = [
+            old for old in Tutorial.iterValids()
+            if old.directory.relative_to(Tutorial.root).as_posix() not in tsv
+        ]
+        with cf.ThreadPoolExecutor(max_workers=max(1, min(jobs, budget.total))) as executor:
+            futures = [
+                executor.submit(
+                    benchmark, old, budget, cache, timeout_foam, timeout_petsc, petsc_options, warmup, number,
+                    slowdown or None, ceiling or None,
+                )
+                for old in olds
+            ]
+            for future in tqdm.tqdm(cf.as_completed(futures), total=len(futures)):
+                row, noise, rows, solvers, stops = future.result()
+                for cells in rows:
+                    summary.append(*cells)
+                for cells in solvers:
+                    breakdown.append(*cells)
+                for cells in stops:
+                    aborts.append(*cells)
+                tsv.append(*row)
+                contention.append(*noise)
+
+    main()
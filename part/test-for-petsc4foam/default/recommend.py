@@ -0,0 +1,138 @@
+import json
+import math as m
+import pathlib as p
+import re
+import sys
+import typing as t
+
+from main import TSV, Tutorial, summarize
+
+
+Options = t.Dict[str, str]
+Scores = t.Dict[t.Tuple[str, str], float]
+
+root = p.Path(__file__).parent
+dir_classifier = root.parents[1] / 'draft' / 'classifier'
+dir_mtx = root.parents[1] / 'hyper-parameter-optimization' / 'training-dataset' / 'foam2mtx' / 'cache' / 'mtx' / '10'
+sys.path.insert(0, dir_classifier.as_posix())
+
+from serve import Recommender
+
+
+def predict_fields(recommender: Recommender, directory: p.Path) -> t.Dict[str, Scores]:
+    '''Probabilities of every `(ksp_type, pc_type)` per dumped field, summed over its time steps
+
+    `directory` is the foam2mtx dump of one tutorial: `<field>/<time index>`.
+    '''
+    ans: t.Dict[str, Scores] = {}
+    for path in sorted(filter(p.Path.is_file, directory.glob('*/*'))):
+        ranking, _ = recommender.recommend(path)
+        scores = ans.setdefault(path.parent.name, {})
+        for ksp_type, pc_type, probability in ranking:
+            scores[ksp_type, pc_type] = scores.get((ksp_type, pc_type), 0.0) + probability
+    return ans
+
+
+def match(key: str, field: str) -> bool:
+    '''Whether a `solvers` keyword (a name or a quoted regular expression) covers a dumped field
+
+    Vector fields are dumped per component (`Ux`, `Uy`, `Uz`) while the keyword names `U`,
+    and the final-corrector keywords (`pFinal`, `"(U|k)Final"`) cover the same fields.
+    '''
+    pattern = key.strip('"')
+    names = {field, field[:-1]} if len(field) > 1 and field[-1] in 'xyz' else {field}
+    for name in names:
+        for candidate in [name, f'{name}Final']:
+            try:
+                if re.fullmatch(pattern, candidate):
+                    return True
+            except re.error:
+                if pattern == candidate:
+                    return True
+    return False
+
+
+class Selector:
+    '''`Tutorial.hook_petsc(select=...)`: best options of the fields a keyword covers
+
+    Keywords covering no dumped field get None, i.e. the fixed options; the choices
+    made are kept in `selected` for the result table.
+    '''
+
+    def __init__(self, fields: t.Dict[str, Scores]) -> None:
+        self._fields = fields
+        self.selected: t.Dict[str, Options] = {}
+
+    def __call__(self, key: str) -> t.Optional[Options]:
+        total: Scores = {}
+        for field, scores in self._fields.items():
+            if match(key, field):
+                for option, score in scores.items():
+                    total[option] = total.get(option, 0.0) + score
+        if not total:
+            return None
+        ksp_type, pc_type = max(total, key=total.__getitem__)
+        self.selected[key] = {'ksp_type': ksp_type, 'pc_type': pc_type}
+        return self.selected[key]
+
+
+def summary(path: p.Path) -> None:
+    '''Speed-up of the recommended options over the fixed ones, per tutorial and geometric mean'''
+    logs = []
+    with open(path, 'r') as file:
+        file.readline()
+        for line in file:
+            tutorial, _, _, _, time_petsc, time_recommend, _ = line.rstrip('\n').split('\t')
+            fixed, recommended = float(time_petsc), float(time_recommend)
+            if fixed > 0 and recommended > 0:
+                logs.append(m.log(fixed/recommended))
+                print(f'{tutorial:<64} {fixed:>10.3f} {recommended:>10.3f} {fixed/recommended:>8.2f}x')
+    if logs:
+        print(f'geometric mean speed-up over {len(logs)} tutorials: {m.exp(sum(logs)/len(logs)):.3f}x')
+
+
+if __name__ == '__main__':
+    import click
+    import tqdm
+
+    @click.command()
+    @click.option('--warmup', type=int, default=0, help='Untimed runs before the timed ones (as for `petsc4foam.tsv`)')
+    @click.option('--number', type=int, default=1, help='Timed runs, whose median wall time is reported (as for `petsc4foam.tsv`)')
+    def main(warmup: int, number: int) -> None:
+        timeout_foam, timeout_petsc = 300.0, 1800.0
+        cache = root / 'cache'
+        petsc_options = {'ksp_type': 'cg', 'pc_type': 'jacobi'}
+        columns = ['tutorial', 'application', 'parallel', 'time_foam', 'time_petsc']
+        baseline = TSV(root/'petsc4foam.tsv', columns)
+        tsv = TSV(root/'petsc4foam-recommend.tsv', [*columns, 'time_recommend', 'petsc_options'], batch=1)
+        recommender = Recommender()
+
+        tutorials = [line.split('\t', 1)[0] for line in (root/'petsc4foam.tsv').read_text().splitlines()[1:]]
+        for tutorial in tqdm.tqdm(tutorials):
+            _, _, time_foam, time_petsc = baseline.get(tutorial)
+            if tutorial in tsv or not float(time_foam) > 0:
+                continue
+            fields = predict_fields(recommender, dir_mtx/tutorial)
+            if not fields:  # not dumped by foam2mtx
+                continue
+            # init
+            new = Tutorial(Tutorial.root/tutorial).copy(cache).hook_foam()
+            keys = tutorial, new.application, new.number_of_subdomains
+            if not new.all_run_or_parallel(timeout=timeout_foam, delete=True):
+                tsv.append(*keys, time_foam, time_petsc, 'nan', '{}')
+                continue
+            # petsc (recommended), measured like `time_petsc`: the median wall time of `number` runs
+            select = Selector(fields)
+            samples = new \
+                .hook_petsc(options=petsc_options, select=select) \
+                .run_or_parallel_measure(timeout=timeout_petsc, delete=True, warmup=warmup, number=number)
+            # tsv
+            tsv.append(
+                *keys, time_foam, time_petsc,
+                -timeout_petsc if samples is None else summarize([sample.wall for sample in samples])['median'],
+                json.dumps(select.selected),
+            )
+        tsv.flush()
+        summary(root/'petsc4foam-recommend.tsv')
+
+    main()
@@ -0,0 +1,160 @@
+import asyncio
+import contextlib as cl
+import math as m
+import os
+import pathlib as p
+import resource
+import signal
+import subprocess as sp
+import time
+import typing as t
+
+import typing_extensions as te
+
+from solverlog import Residual, Sink, feed
+
+
+class Abort(t.NamedTuple):
+    '''Why and when a run was stopped before it finished'''
+
+    reason: str  # 'timeout', 'slower' or 'diverged'
+    seconds: float
+    steps: int
+    detail: str = ''
+
+
+class Outcome(t.NamedTuple):
+    returncode: int
+    wall: float
+    usage: resource.struct_rusage
+    abort: t.Optional[Abort]
+
+
+class Guard:
+    '''`solverlog.Sink` counting steps and flagging residuals that diverge
+
+    A residual diverges when the log prints it as `nan` or `inf` or when an initial
+    residual exceeds `ceiling`; OpenFOAM normalises them, so they hardly ever exceed
+    one otherwise. Residuals that could not be parsed are not checked, and none is
+    when `ceiling` is None.
+    '''
+
+    def __init__(self, ceiling: t.Optional[float] = 1e3) -> None:
+        self.ceiling = ceiling
+        self.steps = 0
+        self.diverged: t.Optional[str] = None
+
+    def solve(self, field: str, solver: str, initial: Residual, final: Residual, iterations: int) -> None:
+        if self.ceiling is None or self.diverged is not None:
+            return
+        if (
+            (initial is not None and not initial <= self.ceiling)  # also nan
+            or (final is not None and not m.isfinite(final))
+        ):
+            self.diverged = f'{field} ({solver}): initial residual {initial}, final residual {final}'
+
+    def step(self, execution: float) -> None:
+        self.steps += 1
+
+
+class Tail:
+    '''New complete lines of a growing file, a bounded partial line kept in between'''
+
+    def __init__(self, path: t.Optional[p.Path], chunk: int = 1 << 20) -> None:
+        self._path = path
+        self._chunk = chunk
+        self._file: t.Optional[t.BinaryIO] = None
+        self._rest = b''
+
+    def __enter__(self) -> te.Self:
+        return self
+
+    def __exit__(self, *args: t.Any) -> None:
+        if self._file is not None:
+            self._file.close()
+
+    def rest(self) -> bytes:
+        '''The partial line kept so far, once the file is known to be complete'''
+        ans, self._rest = self._rest, b''
+        return ans
+
+    def lines(self) -> t.Iterator[bytes]:
+        if self._file is None:
+            if self._path is None or not self._path.exists():
+                return
+            self._file = open(self._path, 'rb')
+        while True:
+            data = self._file.read(self._chunk)
+            if not data:
+                return
+            lines = (self._rest+data).split(b'\n')
+            self._rest = lines.pop()
+            if len(self._rest) > self._chunk:  # no solver writes such lines, drop it
+                self._rest = b''
+            yield from lines
+
+
+async def watch(
+    cmd: str, log: t.Optional[p.Path], timeout: float, limit: t.Optional[float] = None,
+    sinks: t.Sequence[Sink] = (), ceiling: t.Optional[float] = None, poll: float = 0.5,
+    **kwargs: t.Any,
+) -> Outcome:
+    '''Run `cmd` in its own session and follow `log` while it runs
+
+    The output of `cmd` is discarded; the log it writes, if any, is fed to `sinks` as it grows.
+    The whole process group is killed once `timeout` seconds have passed, once `limit`
+    seconds have passed (a run already slower than what it is compared with) or once
+    a residual diverges (see `Guard`). The process is reaped with `wait4`, so `usage`
+    covers its whole tree.
+    '''
+    loop = asyncio.get_running_loop()
+    guard = Guard(ceiling)
+    tic = time.perf_counter()
+    process = sp.Popen(cmd, shell=True, stdout=sp.DEVNULL, stderr=sp.DEVNULL, start_new_session=True, **kwargs)
+    reaper = loop.run_in_executor(None, os.wait4, process.pid, 0)
+    abort = None
+    with Tail(log) as tail:
+        while True:
+            done, _ = await asyncio.wait({reaper}, timeout=poll)
+            for line in tail.lines():
+                feed(line, guard, *sinks)
+                if guard.diverged is not None:
+                    break
+            elapsed = time.perf_counter() - tic
+            # divergence first: a run may have exited in the very poll its log diverged
+            if guard.diverged is not None:
+                abort = Abort('diverged', elapsed, guard.steps, guard.diverged)
+            elif done:
+                feed(tail.rest(), guard, *sinks)  # a last line without a newline
+                break
+            elif elapsed > timeout:
+                abort = Abort('timeout', elapsed, guard.steps)
+            elif limit is not None and elapsed > limit:
+                abort = Abort('slower', elapsed, guard.steps)
+            if abort is not None:
+                if not done:
+                    with cl.suppress(OSError):  # already exited
+                        os.killpg(process.pid, signal.SIGKILL)
+                    await reaper
+                break
+        _, status, usage = reaper.result()
+        toc = time.perf_counter()
+    return Outcome(os.waitstatus_to_exitcode(status), toc - tic, usage, abort)
+
+
+if __name__ == '__main__':
+    import click
+
+    @click.command()
+    @click.argument('cmd')
+    @click.option('--log', type=click.Path(dir_okay=False, path_type=p.Path), required=True, help='Log written by `cmd`')
+    @click.option('--timeout', type=float, default=1800.0)
+    @click.option('--limit', type=float, default=None, help='Abort after these many seconds, e.g. k times the foam time')
+    @click.option('--ceiling', type=float, default=1e3, help='Abort once an initial residual exceeds it')
+    def main(cmd: str, log: p.Path, timeout: float, limit: t.Optional[float], ceiling: float) -> None:
+        outcome = asyncio.run(watch(cmd, log, timeout, limit, ceiling=ceiling))
+        print(f'returncode {outcome.returncode}, wall {outcome.wall:.3f} s, max RSS {outcome.usage.ru_maxrss} KiB')
+        if outcome.abort is not None:
+            print(f'aborted ({outcome.abort.reason}) after {outcome.abort.seconds:.3f} s and {outcome.abort.steps} steps')
+
+    main()
@@ -0,0 +1,288 @@
+import array
+import json
+import math as m
+import pathlib as p
+import re
+import typing as t
+
+import typing_extensions as te
+
+
+SOLVE = re.compile(
+    rb'^\s*(\S+):\s+Solving for (\S+), Initial residual = ([^,]+), '
+    rb'Final residual = ([^,]+), No Iterations (\d+)'
+)
+EXECUTION_TIME = re.compile(rb'^ExecutionTime\s*=\s*([-+.\deE]+)\s*s')
+BREAKDOWN = [
+    'field', 'solver', 'solves', 'iterations', 'iterations_max',
+    'initial_max', 'final_max', 'seconds',
+]
+OTHER = ('-', '-')  # step time the fit leaves to no linear solve
+
+
+Residual = t.Optional[float]  # None when the log holds something unparsable
+
+
+class Sink(te.Protocol):
+    def solve(self, field: str, solver: str, initial: Residual, final: Residual, iterations: int) -> None: ...
+
+    def step(self, execution: float) -> None: ...
+
+
+def number(text: bytes) -> Residual:
+    '''A residual, the largest component of a vector one (coupled solvers), a non-finite one if any'''
+    try:
+        values = [float(part) for part in text.strip().strip(b'()').split()]
+    except ValueError:
+        return None
+    if not values:
+        return None
+    return next((value for value in values if not m.isfinite(value)), max(values))
+
+
+def feed(line: bytes, *sinks: Sink) -> None:
+    '''Pass one log line to `sinks` if it is a linear solve or the end of a time step'''
+    if b'Solving for' in line:
+        match = SOLVE.match(line)
+        if match:
+            solver, field, initial, final, iterations = match.groups()
+            args = field.decode(), solver.decode(), number(initial), number(final), int(iterations)
+            for sink in sinks:
+                sink.solve(*args)
+    elif line.startswith(b'ExecutionTime'):
+        match = EXECUTION_TIME.match(line)
+        if match:
+            for sink in sinks:
+                sink.step(float(match.group(1)))
+
+
+def read(path: p.Path, *sinks: Sink) -> None:
+    '''Stream `log.<application>` into `sinks` line by line, in constant memory'''
+    with open(path, 'rb') as file:
+        for line in file:
+            feed(line, *sinks)
+
+
+class Steps:
+    '''`Sink` keeping the `ExecutionTime` increment of every time step'''
+
+    def __init__(self) -> None:
+        self.execution = m.nan  # last cumulative ExecutionTime, nan without one
+        self.increments: t.List[float] = []
+
+    def solve(self, field: str, solver: str, initial: Residual, final: Residual, iterations: int) -> None:
+        pass
+
+    def step(self, execution: float) -> None:
+        self.increments.append(execution - (self.execution if self.increments else 0.0))
+        self.execution = execution
+
+
+class Profile:
+    '''Constant-memory aggregate of a solver log per `(field, solver)`
+
+    The log only times whole steps, so the seconds of a `(field, solver)` are fitted:
+    every step is modelled as `c_0 + sum(c_k * work_k)` with `work_k` the iterations
+    plus one setup per solve of key `k` in that step, the costs `c_k >= 0` are found by
+    least squares on normal equations accumulated step by step, and key `k` gets
+    `c_k * sum(work_k)`. The rest of the execution time is reported as `OTHER`.
+    '''
+
+    def __init__(self) -> None:
+        # (field, solver) -> [code, solves, iterations, iterations_max, initial_max, final_max, work, pending work]
+        self.keys: t.Dict[t.Tuple[str, str], t.List[t.Any]] = {}
+        self.steps = 0
+        self.execution = 0.0  # last cumulative ExecutionTime
+        self._pending: t.List[t.List[t.Any]] = []
+        self._gram: t.Dict[t.Tuple[int, int], float] = {}  # code -1 is the intercept
+        self._moment: t.Dict[int, float] = {}
+
+    def solve(self, field: str, solver: str, initial: Residual, final: Residual, iterations: int) -> None:
+        row = self.keys.get((field, solver))
+        if row is None:
+            row = self.keys[field, solver] = [len(self.keys), 0, 0, 0, -m.inf, -m.inf, 0.0, 0.0]
+        row[1] += 1
+        row[2] += iterations
+        if iterations > row[3]:
+            row[3] = iterations
+        if initial is not None and not initial <= row[4]:  # a nan sticks
+            row[4] = initial
+        if final is not None and not final <= row[5]:
+            row[5] = final
+        if not row[7]:
+            self._pending.append(row)
+        row[7] += iterations + 1.0
+
+    def step(self, execution: float) -> None:
+        seconds, self.execution = execution - self.execution, execution
+        work = [(-1, 1.0), *((row[0], row[7]) for row in self._pending)]
+        for i, wi in work:
+            self._moment[i] = self._moment.get(i, 0.0) + wi*seconds
+            for j, wj in work:
+                self._gram[i, j] = self._gram.get((i, j), 0.0) + wi*wj
+        for row in self._pending:
+            row[6] += row[7]
+            row[7] = 0.0
+        self._pending.clear()
+        self.steps += 1
+
+    def costs(self) -> t.Dict[int, float]:
+        '''Seconds per unit of work of every key, -1 being the per-step overhead'''
+        active = sorted(self._moment)
+        while active:
+            solution = self._solve(active)
+            if solution is None:
+                return {}
+            negative = min(active, key=solution.__getitem__)
+            if solution[negative] >= 0.0:
+                return solution
+            active.remove(negative)
+        return {}
+
+    def breakdown(self) -> t.List[t.List[t.Any]]:
+        '''Rows of `BREAKDOWN`, the last one being `OTHER`'''
+        costs = self.costs()
+        ans = [
+            [field, solver, *row[1:6], costs.get(row[0], 0.0) * row[6]]
+            for (field, solver), row in self.keys.items()
+        ]
+        other = self.execution - sum(row[-1] for row in ans) if costs else self.execution
+        ans.append([*OTHER, 0, 0, 0, m.nan, m.nan, other])
+        return ans
+
+    def _solve(self, active: t.List[int]) -> t.Optional[t.Dict[int, float]]:
+        '''Normal equations restricted to `active`, by Gaussian elimination with partial pivoting'''
+        n = len(active)
+        ridge = 1e-9 * max(1.0, max(self._gram[i, i] for i in active))
+        a = [
+            [self._gram.get((i, j), 0.0) + (ridge if i == j else 0.0) for j in active] + [self._moment[i]]
+            for i in active
+        ]
+        for col in range(n):
+            pivot = max(range(col, n), key=lambda row: abs(a[row][col]))
+            if a[pivot][col] == 0.0:
+                return None
+            a[col], a[pivot] = a[pivot], a[col]
+            for row in range(col+1, n):
+                ratio = a[row][col] / a[col][col]
+                for k in range(col, n+1):
+                    a[row][k] -= ratio * a[col][k]
+        xs = [0.0] * n
+        for row in reversed(range(n)):
+            xs[row] = (a[row][n] - sum(a[row][k]*xs[k] for k in range(row+1, n))) / a[row][row]
+        return dict(zip(active, xs))
+
+
+class Trace:
+    '''Columnar record of every linear solve and time step of a log
+
+    Fields and solvers are stored as indices into `fields` and `solvers`. With a
+    `directory`, columns are appended to `<directory>/<column>.bin` every `chunk`
+    rows, so memory stays bounded; `load` reads such a directory back into arrays.
+    '''
+
+    SOLVES = {'step': 'I', 'field': 'H', 'solver': 'H', 'initial': 'd', 'final': 'd', 'iterations': 'I'}
+    STEPS = {'execution': 'd'}
+
+    def __init__(self, directory: t.Optional[p.Path] = None, chunk: int = 1 << 16) -> None:
+        self.fields: t.List[str] = []
+        self.solvers: t.List[str] = []
+        self.columns = {key: array.array(code) for key, code in {**self.SOLVES, **self.STEPS}.items()}
+        self._directory = None if directory is None else p.Path(directory)
+        self._chunk = chunk
+        self._steps = 0
+        self._codes: t.Dict[str, t.Dict[str, int]] = {'field': {}, 'solver': {}}
+        if self._directory is not None:
+            self._directory.mkdir(parents=True, exist_ok=True)
+            for key in self.columns:
+                (self._directory/f'{key}.bin').write_bytes(b'')
+
+    def __enter__(self) -> te.Self:
+        return self
+
+    def __exit__(self, *args: t.Any) -> None:
+        self.flush()
+
+    @classmethod
+    def load(cls, directory: p.Path) -> te.Self:
+        directory = p.Path(directory)
+        ans = cls()
+        names = json.loads((directory/'names.json').read_text())
+        ans.fields, ans.solvers, ans._steps = names['fields'], names['solvers'], names['steps']
+        ans._codes = {key: {name: code for code, name in enumerate(names[f'{key}s'])} for key in ans._codes}
+        for key, column in ans.columns.items():
+            column.frombytes((directory/f'{key}.bin').read_bytes())
+        return ans
+
+    def solve(self, field: str, solver: str, initial: Residual, final: Residual, iterations: int) -> None:
+        columns = self.columns
+        columns['step'].append(self._steps)
+        columns['field'].append(self._index(self.fields, self._codes['field'], field))
+        columns['solver'].append(self._index(self.solvers, self._codes['solver'], solver))
+        columns['initial'].append(m.nan if initial is None else initial)
+        columns['final'].append(m.nan if final is None else final)
+        columns['iterations'].append(iterations)
+        if len(columns['step']) >= self._chunk:
+            self.flush()
+
+    def step(self, execution: float) -> None:
+        self.columns['execution'].append(execution)
+        self._steps += 1
+        if len(self.columns['execution']) >= self._chunk:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._directory is None:
+            return
+        for key, column in self.columns.items():
+            with open(self._directory/f'{key}.bin', 'ab') as file:
+                column.tofile(file)
+            del column[:]
+        names = {'fields': self.fields, 'solvers': self.solvers, 'steps': self._steps}
+        (self._directory/'names.json').write_text(json.dumps(names))
+
+    @staticmethod
+    def _index(names: t.List[str], codes: t.Dict[str, int], name: str) -> int:
+        if name not in codes:
+            codes[name] = len(names)
+            names.append(name)
+        return codes[name]
+
+
+def report(path: p.Path) -> None:
+    '''Per tutorial and field: solvers, iterations and fitted seconds of the foam and petsc runs'''
+    rows: t.Dict[str, t.Dict[str, t.Dict[str, t.List[t.Any]]]] = {}
+    with open(path, 'r') as file:
+        file.readline()
+        for line in file:
+            tutorial, variant, field, solver, _, iterations, *_, seconds = line.rstrip('\n').split('\t')
+            cell = rows.setdefault(tutorial, {}).setdefault(field, {}).setdefault(variant, [[], 0, 0.0])
+            cell[0].append(solver)  # a field may have several solvers, e.g. for its final corrector
+            cell[1] += int(iterations)
+            cell[2] += float(seconds)
+    for tutorial, fields in rows.items():
+        print(tutorial)
+        for field, variants in fields.items():
+            cells = [variants.get(variant, [[], '', m.nan]) for variant in ['foam', 'petsc']]
+            line = ' '.join(f'{"+".join(solvers):>16} {iterations:>10} {seconds:>10.3f}' for solvers, iterations, seconds in cells)
+            ratio = cells[0][2] / cells[1][2] if cells[1][2] > 0 else m.nan
+            print(f'    {field:<24} {line} {ratio:>8.2f}x')
+
+
+if __name__ == '__main__':
+    import click
+
+    @click.command()
+    @click.argument('logs', nargs=-1, type=click.Path(exists=True, dir_okay=False, path_type=p.Path))
+    @click.option('--table', type=click.Path(exists=True, dir_okay=False, path_type=p.Path), default=None, help='Report of a `petsc4foam-solvers.tsv` instead')
+    def main(logs: t.Tuple[p.Path, ...], table: t.Optional[p.Path]) -> None:
+        if table is not None:
+            report(table)
+        for log in logs:
+            profile = Profile()
+            read(log, profile)
+            print(f'{log}: {profile.steps} steps, {profile.execution:.3f} s')
+            for field, solver, solves, iterations, iterations_max, _, _, seconds in profile.breakdown():
+                print(f'    {field:<24} {solver:<16} {solves:>8} {iterations:>10} {iterations_max:>6} {seconds:>10.3f}')
+
+    main()
@@ -0,0 +1,161 @@
+import fcntl
+import json
+import os
+import pathlib as p
+import re
+import shutil
+import stat
+import time
+import typing as t
+
+from dictionary import FoamDictionary
+
+
+FICLONE = 0x40049409  # linux/fs.h
+IMMUTABLE = re.compile(r'^(processor\d+/)?constant/(polyMesh|triSurface|extendedFeatureEdgeMesh)/')
+
+
+class Report(t.NamedTuple):
+    '''Staging of one variant: seconds, number of files, and bytes by the way they were staged'''
+
+    name: str
+    variant: str
+    seconds: float
+    files: int
+    copied: int  # new disk use
+    linked: int  # hardlinks into the base, shared
+    reflinked: int  # shared until written
+
+    def __str__(self) -> str:
+        mib = lambda size: f'{size/2**20:.1f}'
+        return '\t'.join([self.name, self.variant, f'{self.seconds:.3f}', str(self.files), *map(mib, self[4:])])
+
+
+def reflink(src: p.Path, dst: p.Path) -> bool:
+    '''Copy-on-write clone of `src` (btrfs, xfs, ...), False where unsupported'''
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            ok = False
+        else:
+            ok = True
+    if ok:
+        shutil.copystat(src, dst)
+    else:
+        dst.unlink()
+    return ok
+
+
+def clone(src: str, dst: str) -> str:
+    '''`shutil.copytree(copy_function=...)`: reflink when possible, a plain copy otherwise'''
+    if not reflink(p.Path(src), p.Path(dst)):
+        shutil.copy2(src, dst)
+    return dst
+
+
+def is_time(name: str) -> bool:
+    try:
+        float(name)
+    except ValueError:
+        return False
+    return True
+
+
+class Stage:
+    '''Preprocessed base cases and cheap per-variant clones of them
+
+    `base` copies a tutorial once and runs its preprocessing there; `variant`
+    clones the base without its logs and result time directories, then copies an
+    overlay (e.g. a patched `system/`) on top. Files are reflinked when the
+    filesystem allows it; otherwise mesh files (`constant/polyMesh` and friends,
+    made read-only in the base so that no run can alter them) are hardlinked and
+    the rest is copied.
+    '''
+
+    def __init__(self, root: p.Path) -> None:
+        self._root = p.Path(root)
+        self._reflink: t.Optional[bool] = None
+
+    def base(self, name: str, src: p.Path, prepare: t.Callable[[p.Path], bool]) -> t.Optional[p.Path]:
+        '''Preprocessed copy of `src`, rebuilt only when `src` changed'''
+        directory = self._root / 'base' / name
+        stamp = directory / '.staged'
+        signature = json.dumps(sorted(
+            (path.relative_to(src).as_posix(), path.stat().st_mtime_ns)
+            for path in p.Path(src).rglob('*') if path.is_file()
+        ))
+        if stamp.exists() and stamp.read_text() == signature:
+            return directory
+        self._rmtree(directory)
+        shutil.copytree(src, directory)
+        if not prepare(directory):
+            return None
+        for path in self._files(directory):
+            if IMMUTABLE.match(path.relative_to(directory).as_posix()):
+                path.chmod(path.stat().st_mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+        stamp.write_text(signature)
+        return directory
+
+    def variant(self, name: str, variant: str, overlay: t.Optional[p.Path] = None) -> t.Tuple[p.Path, Report]:
+        '''Fresh clone of the base of `name` with `overlay` copied over it'''
+        base, dst = self._root / 'base' / name, self._root / 'variant' / name / variant
+        tic = time.perf_counter()
+        self._rmtree(dst)
+        start = self._start(base)
+        sizes = {'copied': 0, 'linked': 0, 'reflinked': 0}
+        files = 0
+        for path in self._files(base):
+            relative = path.relative_to(base)
+            if not self._keep(relative, start):
+                continue
+            target = dst / relative
+            target.parent.mkdir(parents=True, exist_ok=True)
+            sizes[self._clone(path, target, IMMUTABLE.match(relative.as_posix()) is not None)] += path.stat().st_size
+            files += 1
+        if overlay is not None:
+            for path in self._files(p.Path(overlay)):
+                target = dst / path.relative_to(overlay)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                if target.exists():
+                    target.unlink()  # never write through a link into the base
+                shutil.copy2(path, target)
+                sizes['copied'] += path.stat().st_size
+                files += 1
+        return dst, Report(name, variant, time.perf_counter()-tic, files, **sizes)
+
+    def _clone(self, src: p.Path, dst: p.Path, immutable: bool) -> str:
+        if self._reflink is not False:
+            self._reflink = reflink(src, dst)
+            if self._reflink:
+                return 'reflinked'
+        if immutable:
+            os.link(src, dst)
+            return 'linked'
+        shutil.copy2(src, dst)
+        return 'copied'
+
+    @staticmethod
+    def _keep(relative: p.Path, start: str) -> bool:
+        '''Skip the staging stamp, logs and every time directory but the start one'''
+        parts = relative.parts
+        if relative.name == '.staged' or (len(parts) == 1 and relative.name.startswith('log.')):
+            return False
+        head = parts[1] if parts[0].startswith('processor') and len(parts) > 1 else parts[0]
+        return len(parts) == 1 or not is_time(head) or float(head) == float(start)
+
+    @staticmethod
+    def _start(base: p.Path) -> str:
+        start = FoamDictionary(base/'system'/'controlDict').value('startTime')
+        return start if start is not None and is_time(start) else '0'
+
+    @staticmethod
+    def _files(directory: p.Path) -> t.Iterator[p.Path]:
+        for root, _, files in os.walk(directory):
+            for file in files:
+                yield p.Path(root) / file
+
+    @staticmethod
+    def _rmtree(directory: p.Path) -> None:
+        # read-only mesh files sit in writable directories, so they can be removed
+        shutil.rmtree(directory, ignore_errors=True)
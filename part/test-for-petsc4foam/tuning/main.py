@@ -1,48 +1,138 @@
-import collections as c
+import concurrent.futures as cf
+import itertools as it
 import json
+import math as m
 import pathlib as p
-import shutil
-import subprocess as sp
-import time
-
-
-def copytree(src: p.Path, dst: p.Path) -> None:
-    dst.mkdir(parents=True, exist_ok=True)
-    for path_src in src.rglob('*'):
-        path_dst = dst / path_src.relative_to(src)
-        if path_src.is_dir():
-            path_dst.mkdir(parents=True, exist_ok=True)
-        elif path_src.is_file():
-            shutil.copy(path_src, path_dst)
-
-
-tutorial = p.Path('mixerVessel2D')
-src, patches, data = tutorial/'original', tutorial/'patch', tutorial/'data.json'
-dst = p.Path('cache')
-number = 5
-
-if data.exists():
-    exit()
-
-times = c.defaultdict(list)
-shutil.rmtree(dst, ignore_errors=True)
-copytree(src, dst)
-application = sp.run(
-    'foamDictionary system/controlDict -entry application -value',
-    shell=True, cwd=dst, capture_output=True,
-).stdout.decode().strip()
-# pre-process
-sp.run('./Allrun', shell=True, cwd=dst, capture_output=True)
-# original
-for _ in range(number):
-    tic = time.perf_counter()
-    cp = sp.run(application, shell=True, cwd=dst, capture_output=True)
-    times['original'].append(time.perf_counter() - tic)
-# patches
-for patch in patches.iterdir():
-    copytree(patch, dst)
-    for _ in range(number):
-        tic = time.perf_counter()
-        cp = sp.run(application, shell=True, cwd=dst, capture_output=True)
-        times[patch.name].append(time.perf_counter() - tic)
-data.write_text(json.dumps(times))
+import random
+import sys
+import typing as t
+
+import click
+
+root = p.Path(__file__).parent
+sys.path.insert(0, (root.parent/'default').as_posix())
+
+from main import Cores, Sample, TSV, Tutorial, summarize
+from staging import Stage
+
+
+Variant = t.Tuple[str, t.Optional[p.Path], t.Optional[t.Dict[str, str]]]  # name, overlay, PETSc options
+COLUMNS = ['variant', 'repetition', 'wall', 'cpu', 'maxrss', 'execution']
+
+
+def variants(patches: t.Optional[p.Path], grid: t.Dict[str, t.List[str]]) -> t.List[Variant]:
+    '''`original`, one variant per patch directory, and one per point of the PETSc options grid'''
+    ans: t.List[Variant] = [('original', None, None)]
+    if patches is not None and patches.is_dir():
+        ans.extend((patch.name, patch, None) for patch in sorted(patches.iterdir()) if patch.is_dir())
+    keys = sorted(grid)
+    for values in it.product(*(grid[key] for key in keys)):
+        if keys:
+            options = dict(zip(keys, map(str, values)))
+            ans.append((','.join(f'{key}={val}' for key, val in options.items()), None, options))
+    return ans
+
+
+def seed(store: TSV, path: p.Path) -> None:
+    '''Import the wall times of the former `data.json` ({variant: [seconds, ...]}) as `<variant>@data.json`
+
+    Those were measured differently (the bare application, patches applied one after
+    another), so they are kept apart from the variants measured here.
+    '''
+    for variant, times in json.loads(path.read_text()).items():
+        for repetition, wall in enumerate(times):
+            if store.get(f'{variant}@{path.name}', str(repetition)) is None:
+                store.append(f'{variant}@{path.name}', repetition, wall, 'nan', 'nan', 'nan')
+    store.flush()
+
+
+def measure(tutorial: Tutorial, cores: Cores, timeout: float) -> t.Optional[Sample]:
+    with cores.reserve(tutorial.cores) as loan:
+        samples = tutorial.pin(loan.cpus).run_or_parallel_measure(timeout=timeout, warmup=0, number=1)
+    return samples[0] if samples else None
+
+
+def table(store: p.Path, names: t.List[str]) -> None:
+    '''Median wall time, IQR, 95% interval of the median and speed-up against `original`
+
+    Variants are listed in the order of `names`, then the other ones of `store` (e.g.
+    imported ones); those without any finished run are left out.
+    '''
+    walls: t.Dict[str, t.List[float]] = {}
+    with open(store, 'r') as file:
+        file.readline()
+        for line in file:
+            variant, _, wall, *_ = line.rstrip('\n').split('\t')
+            if m.isfinite(float(wall)):
+                walls.setdefault(variant, []).append(float(wall))
+
+    def baseline(name: str) -> float:
+        # imported variants are compared with the `original` imported alongside them
+        reference = 'original' + name[name.find('@'):] if '@' in name else 'original'
+        return summarize(walls.get(reference, []))['median']
+
+    print(f'{"variant":<40} {"n":>3} {"median/s":>10} {"iqr/s":>8} {"ci/s":>21} {"speed-up":>9}')
+    for name in [*names, *sorted(set(walls)-set(names))]:
+        if name not in walls:
+            continue
+        s = summarize(walls[name])
+        ci = f'[{s["ci_low"]:.3f}, {s["ci_high"]:.3f}]'
+        print(
+            f'{name:<40} {len(walls[name]):>3} {s["median"]:>10.3f} {s["iqr"]:>8.3f} '
+            f'{ci:>21} {baseline(name)/s["median"]:>8.3f}x'
+        )
+
+
+@click.command()
+@click.option('--tutorial', type=click.Path(exists=True, file_okay=False, path_type=p.Path), default=root/'mixerVessel2D'/'original')
+@click.option('--patches', type=click.Path(file_okay=False, path_type=p.Path), default=root/'mixerVessel2D'/'patch', help='Directory of overlays, one sub-directory per variant')
+@click.option('--grid', type=str, default='{}', help='PETSc options grid as JSON, e.g. {"ksp_type": ["cg", "bicg"]}')
+@click.option('--store', type=click.Path(dir_okay=False, path_type=p.Path), default=None, help='Result table (default: data.tsv next to the tutorial)')
+@click.option('--number', type=int, default=5, help='Repetitions per variant')
+@click.option('--jobs', type=int, default=1, help='Variants running at the same time')
+@click.option('--cores', type=int, default=None, help='Number of CPUs to use (default: all)')
+@click.option('--timeout', type=float, default=1800.0)
+@click.option('--seed', 'random_seed', type=int, default=0, help='Seed of the order of the variants in every round')
+def main(
+    tutorial: p.Path, patches: p.Path, grid: str, store: t.Optional[p.Path], number: int,
+    jobs: int, cores: t.Optional[int], timeout: float, random_seed: int,
+) -> None:
+    name = tutorial.parent.name if tutorial.name == 'original' else tutorial.name
+    store = tutorial.parent/'data.tsv' if store is None else store
+    results = TSV(store, COLUMNS, keys=2, batch=1)
+    if (tutorial.parent/'data.json').exists():
+        seed(results, tutorial.parent/'data.json')
+    todo = variants(patches, json.loads(grid))
+    pending = [
+        variant for variant in todo
+        if any(results.get(variant[0], str(repetition)) is None for repetition in range(number))
+    ]
+    if pending:
+        stage = Stage(root/'cache')
+        base = stage.base(name, tutorial, prepare=lambda directory: Tutorial(directory).all_run_or_parallel(timeout=timeout))
+        assert base is not None, f'{tutorial}/Allrun failed'
+        staged = {}
+        for variant in pending:
+            dst, report = stage.variant(name, variant[0], variant[1])
+            staged[variant[0]] = Tutorial(dst).hook_foam()
+            if variant[2] is not None:
+                staged[variant[0]].hook_petsc(options=variant[2])
+            print(report)
+        budget = Cores(cores)
+        rng = random.Random(random_seed)
+        # rounds: every variant once per round, in a new random order, so that drift hits all alike
+        with cf.ThreadPoolExecutor(max_workers=max(1, min(jobs, budget.total))) as executor:
+            for repetition in range(number):
+                names = [key for key in staged if results.get(key, str(repetition)) is None]
+                rng.shuffle(names)
+                samples = executor.map(lambda key: measure(staged[key], budget, timeout), names)
+                for key, sample in zip(names, samples):
+                    if sample is None:
+                        results.append(key, repetition, 'nan', 'nan', 'nan', 'nan')
+                    else:
+                        results.append(key, repetition, sample.wall, sample.cpu, sample.maxrss, sample.execution)
+    table(store, [variant[0] for variant in todo])
+
+
+if __name__ == '__main__':
+    main()